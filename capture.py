@@ -0,0 +1,214 @@
+import os
+import queue
+import struct
+import subprocess
+import threading
+import zlib
+
+
+def encode_png(width, height, rgb):
+    """Encode top-down rgb24 pixels as a PNG file (no external deps)."""
+    stride = width * 3
+    # Filter type 0 (None) in front of every scanline.
+    raw = b"".join(b"\x00" + rgb[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class PngSequenceWriter:
+    """Writes each frame to `pattern.format(index=...)`.
+
+    A pattern without a placeholder names a single file, which is how
+    screenshots are written.
+    """
+
+    def __init__(self, pattern="capture/frame_{index:06d}.png"):
+        self.pattern = pattern
+
+    def write(self, index, width, height, rgb):
+        path = self.pattern.format(index=index)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(encode_png(width, height, rgb))
+
+    def close(self):
+        pass
+
+
+class RawVideoWriter:
+    """Streams frames as raw rgb24 to a file or to another process's stdin.
+
+    A file can be encoded afterwards with e.g.
+    `ffmpeg -f rawvideo -pixel_format rgb24 -video_size WxH -framerate 60
+    -i capture.rgb out.mp4`; pass that ffmpeg command (with `-i -`) as
+    `command` to encode while recording instead.
+    """
+
+    def __init__(self, path="capture.rgb", command=None):
+        self.process = None
+        if command is not None:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            self.stream = self.process.stdin
+        else:
+            self.stream = open(path, "wb")
+
+    def write(self, index, width, height, rgb):
+        self.stream.write(rgb)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            # Reap the encoder even if it already exited and broke the pipe.
+            if self.process is not None:
+                self.process.wait()
+
+
+class CaptureStats:
+    def __init__(self):
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return (
+            f"CaptureStats(captured={self.captured}, written={self.written}, "
+            f"dropped={self.dropped})"
+        )
+
+
+class FrameCapture:
+    """Reads frames back through a ring of pixel buffers without stalling.
+
+    Each `capture` call queues an asynchronous copy of the framebuffer into
+    the next buffer of the ring and collects the copy issued `ring_size`
+    frames earlier, which the GPU has long finished by then. Completed
+    frames go to a background thread that flips them top-down and hands
+    them to `writer`. When the writer falls more than `queue_size` frames
+    behind, frames are dropped (and counted) rather than blocking the
+    render loop. If the writer raises, the thread keeps draining (and
+    dropping) frames so nothing blocks, capturing stops, and `close`
+    re-raises the error; it is also kept in `error`.
+    """
+
+    def __init__(self, ctx, width, height, writer, ring_size=3, queue_size=8, max_frames=None):
+        self.ctx = ctx
+        self.width = width
+        self.height = height
+        self.writer = writer
+        self.max_frames = max_frames
+        self.stats = CaptureStats()
+
+        frame_bytes = width * height * 3
+        self.ring = [ctx.buffer(reserve=frame_bytes) for _ in range(ring_size)]
+        self.pending = [None] * ring_size
+        self.next_slot = 0
+        self.next_index = 0
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._write_loop, name="capture-writer", daemon=True)
+        self.thread.start()
+        self.closed = False
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.max_frames is not None and self.next_index >= self.max_frames
+
+    def capture(self, framebuffer):
+        """Call after drawing a frame and before swapping buffers."""
+        if self.closed or self.error is not None:
+            return
+        slot = self.next_slot
+        self._collect(slot)
+        if self.finished:
+            return
+
+        framebuffer.read_into(
+            self.ring[slot], viewport=(0, 0, self.width, self.height), components=3, alignment=1
+        )
+        self.pending[slot] = self.next_index
+        self.next_index += 1
+        self.next_slot = (slot + 1) % len(self.ring)
+        self.stats.captured += 1
+
+    def _collect(self, slot):
+        index = self.pending[slot]
+        if index is None:
+            return
+        self.pending[slot] = None
+        try:
+            self.queue.put_nowait((index, self.ring[slot].read()))
+        except queue.Full:
+            self.stats.dropped += 1
+
+    def _write_loop(self):
+        stride = self.width * 3
+        while True:
+            item = self.queue.get()
+            if item is None:
+                try:
+                    self.writer.close()
+                except Exception as exc:
+                    if self.error is None:
+                        self.error = exc
+                break
+            if self.error is not None:
+                self.stats.dropped += 1
+                continue
+            index, data = item
+            # GL rows start at the bottom of the image.
+            rgb = b"".join(
+                data[y * stride:(y + 1) * stride] for y in range(self.height - 1, -1, -1)
+            )
+            try:
+                self.writer.write(index, self.width, self.height, rgb)
+            except Exception as exc:
+                self.error = exc
+                self.stats.dropped += 1
+                continue
+            self.stats.written += 1
+
+    def close(self, wait=True):
+        """Collect frames still in flight and release the pixel buffers.
+
+        With `wait=False` the writer thread finishes the remaining frames
+        in the background instead of blocking the caller; call `join`
+        later to wait for it.
+        """
+        if self.closed:
+            if wait:
+                self.join()
+            return
+        self.closed = True
+        for offset in range(len(self.ring)):
+            slot = (self.next_slot + offset) % len(self.ring)
+            index = self.pending[slot]
+            if index is None:
+                continue
+            self.pending[slot] = None
+            # Shutting down, so block rather than drop.
+            self.queue.put((index, self.ring[slot].read()))
+        self.queue.put(None)
+        for buffer in self.ring:
+            buffer.release()
+        if wait:
+            self.join()
+
+    def join(self):
+        """Wait for the writer to finish and re-raise any error it hit."""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,181 @@
+import sys
+import threading
+from collections import namedtuple
+
+import glfw
+
+
+# Everything the render thread needs to draw one frame. Built by the game
+# thread and never mutated afterwards.
+#   camera_pos:      (x, y, z)
+#   camera_rotation: (pitch, yaw)
+#   transforms:      ((mesh, mat4), ...) model matrices to apply
+#   color_updates:   ((mesh, triangle_index, color), ...)
+#   cursor_locked:   True/False to change the cursor mode, None to leave it
+#   title:           new window title, or None
+FrameDescription = namedtuple(
+    "FrameDescription",
+    ["camera_pos", "camera_rotation", "transforms", "color_updates", "cursor_locked", "title"],
+    defaults=((), (), None, None),
+)
+
+# Stats of the last frame the render thread finished, handed back to the
+# game thread. Each object is replaced, never mutated, once its frame is
+# done, so the game thread can read them while the next frame renders.
+RenderFeedback = namedtuple(
+    "RenderFeedback", ["render", "cull", "lod"], defaults=(None, None, None)
+)
+
+
+class FrameMailbox:
+    """Single-producer, single-consumer handoff of immutable frames.
+
+    The game thread publishes `(sequence, frame)` with one reference store
+    and the render thread records the last sequence it consumed in its own
+    attribute. Each field has exactly one writer and reference assignment
+    is atomic in CPython, so neither side takes a lock. The slot being
+    drawn, the slot being built and the published slot are distinct
+    objects, which gives triple-buffer behaviour.
+
+    `take` also sets an event so a game thread that is far enough ahead
+    can sleep until the render thread catches up instead of polling.
+    `feedback` flows the other way and is written only by the render
+    thread.
+    """
+
+    def __init__(self):
+        self._latest = (0, None)
+        self.consumed = 0
+        self.feedback = RenderFeedback()
+        self._taken = threading.Event()
+
+    @property
+    def published(self):
+        return self._latest[0]
+
+    def publish(self, frame):
+        self._latest = (self._latest[0] + 1, frame)
+
+    def take(self):
+        """Newest unconsumed frame, or None if nothing new was published."""
+        sequence, frame = self._latest
+        if sequence == self.consumed:
+            return None
+        self.consumed = sequence
+        self._taken.set()
+        return frame
+
+    def wait_until_behind(self, max_ahead, timeout=0.1):
+        """Block until fewer than `max_ahead` published frames are unconsumed.
+
+        Returns False on timeout so the caller can check for shutdown.
+        """
+        # Clear before checking: a `take` after the check sets the event
+        # again, so the wakeup cannot be lost.
+        self._taken.clear()
+        if self.published - self.consumed < max_ahead:
+            return True
+        return self._taken.wait(timeout)
+
+    def wake(self):
+        self._taken.set()
+
+
+class FramePipeline:
+    """Overlaps game simulation with GL submission and vsync waits.
+
+    `update(dt)` runs on a game thread and returns a `FrameDescription`
+    (or None to quit). The calling thread owns the GL context and the GLFW
+    event loop, as GLFW requires, and draws the previous frame meanwhile.
+    The game thread runs at most `max_frames_ahead` frames ahead so no
+    frame, and none of its color updates, is ever dropped. Blocking in
+    `swap_buffers` releases the GIL, which is where most of the overlap
+    comes from.
+
+    `feedback` holds the `RenderFeedback` of the last drawn frame; read it
+    from `update` instead of querying the renderer, which the render thread
+    is busy mutating.
+
+    With `threaded=False` both halves run alternately on the calling
+    thread, which is handy for debugging.
+    """
+
+    def __init__(self, renderer, update, threaded=True, max_frames_ahead=1):
+        self.renderer = renderer
+        self.update = update
+        self.threaded = threaded
+        self.max_frames_ahead = max_frames_ahead
+        self.mailbox = FrameMailbox()
+        self.running = False
+        self._error = None
+        self._last_time = None
+
+    @property
+    def feedback(self):
+        return self.mailbox.feedback
+
+    def _tick(self):
+        now = glfw.get_time()
+        dt = now - self._last_time
+        self._last_time = now
+        frame = self.update(dt)
+        if frame is None:
+            self.running = False
+            return
+        self.mailbox.publish(frame)
+
+    def _game_loop(self):
+        try:
+            while self.running:
+                if not self.mailbox.wait_until_behind(self.max_frames_ahead):
+                    continue
+                if self.running:
+                    self._tick()
+        except BaseException:
+            self._error = sys.exc_info()
+            self.running = False
+
+    def _apply(self, frame):
+        renderer = self.renderer
+        renderer.set_camera_position(*frame.camera_pos)
+        renderer.set_camera_rotation(*frame.camera_rotation)
+        for mesh, mat4 in frame.transforms:
+            mesh.set_model_matrix(mat4)
+        for mesh, triangle_index, color in frame.color_updates:
+            mesh.set_triangle_color(triangle_index, color)
+        if frame.cursor_locked is not None and frame.cursor_locked != renderer.cursor_locked:
+            renderer.set_cursor_locked(frame.cursor_locked)
+        if frame.title is not None:
+            glfw.set_window_title(renderer.window, frame.title)
+
+    def run(self):
+        self.running = True
+        self._last_time = glfw.get_time()
+
+        game_thread = None
+        if self.threaded:
+            game_thread = threading.Thread(target=self._game_loop, name="game", daemon=True)
+            game_thread.start()
+
+        try:
+            while self.running and not glfw.window_should_close(self.renderer.window):
+                if not self.threaded:
+                    self._tick()
+                frame = self.mailbox.take()
+                if frame is not None:
+                    self._apply(frame)
+                self.renderer.run()
+                self.mailbox.feedback = RenderFeedback(
+                    render=self.renderer.get_render_stats(),
+                    cull=self.renderer.get_cull_stats(),
+                    lod=self.renderer.get_lod_stats(),
+                )
+        finally:
+            self.running = False
+            self.mailbox.wake()
+            if game_thread is not None:
+                game_thread.join()
+            self.renderer.close()
+
+        if self._error is not None:
+            raise self._error[1].with_traceback(self._error[2])
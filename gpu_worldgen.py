@@ -0,0 +1,242 @@
+import struct
+
+import moderngl
+
+from worldapi import build_permutation, generate_world_heights
+
+
+# Renderer strings of software rasterizers. Running fBm there is slower than
+# the CPU path, so those contexts always fall back.
+_SOFTWARE_RENDERERS = ("llvmpipe", "softpipe", "swiftshader", "swrast", "software")
+
+# Worst absolute difference (in normalized height units) tolerated between
+# the shader output and the CPU reference before the backend is disabled.
+GPU_HEIGHT_TOLERANCE = 1e-4
+
+
+_FULLSCREEN_VS = """
+#version 330
+void main() {
+    // Single triangle covering the whole viewport.
+    vec2 pos = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    gl_Position = vec4(pos * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+
+_FBM_FS = """
+#version 330
+uniform sampler2D perm_tex;
+uniform float noise_scale;
+uniform int octaves;
+uniform float lacunarity;
+uniform float gain;
+out float out_height;
+
+int perm(int i) {
+    return int(texelFetch(perm_tex, ivec2(i, 0), 0).r);
+}
+
+float grad(int hash_value, float x, float y) {
+    int h = hash_value & 3;
+    float u = h < 2 ? x : y;
+    float v = h < 2 ? y : x;
+    return ((h & 1) == 0 ? u : -u) + ((h & 2) == 0 ? v : -v);
+}
+
+float fade(float t) {
+    return t * t * t * (t * (t * 6.0 - 15.0) + 10.0);
+}
+
+float perlin2d(float x, float y) {
+    float fx = floor(x);
+    float fy = floor(y);
+    int xi = int(fx) & 255;
+    int yi = int(fy) & 255;
+    float xf = x - fx;
+    float yf = y - fy;
+
+    float u = fade(xf);
+    float v = fade(yf);
+
+    int aa = perm(perm(xi) + yi);
+    int ab = perm(perm(xi) + yi + 1);
+    int ba = perm(perm(xi + 1) + yi);
+    int bb = perm(perm(xi + 1) + yi + 1);
+
+    float x1 = mix(grad(aa, xf, yf), grad(ba, xf - 1.0, yf), u);
+    float x2 = mix(grad(ab, xf, yf - 1.0), grad(bb, xf - 1.0, yf - 1.0), u);
+    return mix(x1, x2, v);
+}
+
+void main() {
+    ivec2 cell = ivec2(gl_FragCoord.xy);
+    float nx = float(cell.x) * noise_scale;
+    float nz = float(cell.y) * noise_scale;
+
+    float amplitude = 1.0;
+    float frequency = 1.0;
+    float total = 0.0;
+    float norm = 0.0;
+    for (int i = 0; i < octaves; i++) {
+        total += perlin2d(nx * frequency, nz * frequency) * amplitude;
+        norm += amplitude;
+        amplitude *= gain;
+        frequency *= lacunarity;
+    }
+    float h = norm > 0.0 ? total / norm : 0.0;
+    h = (h + 1.0) * 0.5;
+    out_height = h * h + 0.5;
+}
+"""
+
+# Transform feedback pass: one point per grid vertex, laid out exactly like
+# the CPU-built terrain in main.py (row-major, x fastest).
+_VERTEX_VS = """
+#version 330
+uniform sampler2D heights;
+uniform int row_len;
+uniform vec2 offset;
+uniform float height_scale;
+out vec3 out_pos;
+
+void main() {
+    int x = gl_VertexID % row_len;
+    int z = gl_VertexID / row_len;
+    float h = texelFetch(heights, ivec2(x, z), 0).r;
+    out_pos = vec3(float(x) + offset.x, (h - 0.45) * height_scale, float(z) + offset.y);
+}
+"""
+
+
+class GpuWorldGen:
+    """Perlin/fBm height generation on an existing moderngl context.
+
+    Heights are rendered into an R32F texture (one texel per grid vertex)
+    and the terrain vertex buffer is derived from that texture with
+    transform feedback, so neither step touches the CPU. When the context
+    is software-rendered, shaders fail to compile, or a probe grid does not
+    match the CPU reference, `available` is False and every call falls back
+    to `worldapi.generate_world_heights`.
+    """
+
+    def __init__(self, ctx, tolerance=GPU_HEIGHT_TOLERANCE):
+        self.ctx = ctx
+        self.tolerance = tolerance
+        self.available = False
+        self.fallback_reason = None
+
+        if ctx is None:
+            self.fallback_reason = "no context"
+            return
+
+        renderer_name = ctx.info.get("GL_RENDERER", "").lower()
+        if any(name in renderer_name for name in _SOFTWARE_RENDERERS):
+            self.fallback_reason = f"software renderer ({renderer_name})"
+            return
+
+        try:
+            self._fbm_program = ctx.program(
+                vertex_shader=_FULLSCREEN_VS, fragment_shader=_FBM_FS
+            )
+            self._fbm_vao = ctx.vertex_array(self._fbm_program, [])
+            self._vertex_program = ctx.program(
+                vertex_shader=_VERTEX_VS, varyings=["out_pos"]
+            )
+            self._vertex_vao = ctx.vertex_array(self._vertex_program, [])
+            self.available = True
+            error = self.max_error(width=16, depth=16, noise_scale=0.37, seed=1337)
+        except moderngl.Error as exc:
+            self.available = False
+            self.fallback_reason = f"shader setup failed: {exc}"
+            return
+
+        if error > self.tolerance:
+            self.available = False
+            self.fallback_reason = f"probe mismatch ({error:.2e} > {self.tolerance:.2e})"
+
+    def generate_height_texture(
+        self,
+        width=120,
+        depth=120,
+        noise_scale=0.06,
+        seed=1337,
+        octaves=5,
+        lacunarity=2.0,
+        gain=0.5,
+    ):
+        if not self.available:
+            raise RuntimeError(f"GPU world generation unavailable: {self.fallback_reason}")
+
+        perm = build_permutation(seed)
+        perm_tex = self.ctx.texture((len(perm), 1), 1, struct.pack(f"{len(perm)}f", *perm), dtype="f4")
+        perm_tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
+
+        heights_tex = self.ctx.texture((width + 1, depth + 1), 1, dtype="f4")
+        heights_tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        fbo = self.ctx.framebuffer(color_attachments=[heights_tex])
+
+        prog = self._fbm_program
+        prog["perm_tex"].value = 0
+        prog["noise_scale"].value = noise_scale
+        prog["octaves"].value = octaves
+        prog["lacunarity"].value = lacunarity
+        prog["gain"].value = gain
+
+        previous_fbo = self.ctx.fbo
+        perm_tex.use(location=0)
+        fbo.use()
+        self._fbm_vao.render(moderngl.TRIANGLES, vertices=3)
+        previous_fbo.use()
+
+        fbo.release()
+        perm_tex.release()
+        return heights_tex
+
+    def build_vertex_buffer(self, heights_tex, height_scale):
+        """Derive the `3f` terrain vertex buffer from a height texture."""
+        row_len, rows = heights_tex.size
+        width = row_len - 1
+        depth = rows - 1
+        num_vertices = row_len * rows
+
+        prog = self._vertex_program
+        prog["heights"].value = 0
+        prog["row_len"].value = row_len
+        prog["offset"].value = (-width / 2.0, -depth / 2.0)
+        prog["height_scale"].value = height_scale
+
+        vbo = self.ctx.buffer(reserve=num_vertices * 3 * 4)
+        heights_tex.use(location=0)
+        self._vertex_vao.transform(vbo, mode=moderngl.POINTS, vertices=num_vertices)
+        return vbo
+
+    def read_heights(self, heights_tex):
+        row_len, rows = heights_tex.size
+        data = struct.unpack(f"{row_len * rows}f", heights_tex.read())
+        return [list(data[z * row_len:(z + 1) * row_len]) for z in range(rows)]
+
+    def generate_world_heights(self, width=120, depth=120, noise_scale=0.06, seed=1337):
+        if not self.available:
+            return generate_world_heights(
+                width=width, depth=depth, noise_scale=noise_scale, seed=seed
+            )
+        heights_tex = self.generate_height_texture(
+            width=width, depth=depth, noise_scale=noise_scale, seed=seed
+        )
+        heights = self.read_heights(heights_tex)
+        heights_tex.release()
+        return heights, width, depth
+
+    def max_error(self, width=120, depth=120, noise_scale=0.06, seed=1337):
+        """Largest absolute difference between the GPU and CPU height maps."""
+        gpu_heights, _, _ = self.generate_world_heights(
+            width=width, depth=depth, noise_scale=noise_scale, seed=seed
+        )
+        cpu_heights, _, _ = generate_world_heights(
+            width=width, depth=depth, noise_scale=noise_scale, seed=seed
+        )
+        return max(
+            abs(g - c)
+            for gpu_row, cpu_row in zip(gpu_heights, cpu_heights)
+            for g, c in zip(gpu_row, cpu_row)
+        )
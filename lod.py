@@ -0,0 +1,346 @@
+import math
+import struct
+import time
+
+import moderngl
+
+from mathhelpers import mat4_mul, orthographic, rotation_y, transform_point, translate
+
+
+_IMPOSTOR_VS = """
+#version 330
+in vec2 in_corner;
+in vec3 in_center;
+in vec3 in_axis_u;
+in vec3 in_axis_v;
+in vec4 in_uv_rect;
+uniform mat4 view_proj;
+out vec2 v_uv;
+
+void main() {
+    vec3 pos = in_center + in_corner.x * in_axis_u + in_corner.y * in_axis_v;
+    v_uv = in_uv_rect.xy + (in_corner * 0.5 + 0.5) * in_uv_rect.zw;
+    gl_Position = view_proj * vec4(pos, 1.0);
+}
+"""
+
+_IMPOSTOR_FS = """
+#version 330
+uniform sampler2D atlas;
+in vec2 v_uv;
+out vec4 fragColor;
+
+void main() {
+    vec4 texel = texture(atlas, v_uv);
+    if (texel.a < 0.5) {
+        discard;
+    }
+    fragColor = vec4(texel.rgb, 1.0);
+}
+"""
+
+# Floats per impostor instance: center, axis_u, axis_v, uv rect.
+_INSTANCE_FLOATS = 3 + 3 + 3 + 4
+
+
+class LodStats:
+    def __init__(self):
+        self.full = 0
+        self.impostors = 0
+        self.baked = 0
+        self.switches = 0
+        self.cpu_saved_ms = 0.0
+        self.gpu_saved_ms = 0.0
+
+    def __repr__(self):
+        return (
+            f"LodStats(full={self.full}, impostors={self.impostors}, baked={self.baked}, "
+            f"switches={self.switches}, cpu_saved_ms={self.cpu_saved_ms:.3f}, "
+            f"gpu_saved_ms={self.gpu_saved_ms:.3f})"
+        )
+
+
+class ImpostorLOD:
+    """Swaps distant meshes for cached impostor cards drawn in one batch.
+
+    A mesh whose projected bounding sphere is smaller than `switch_pixels`
+    (in diameter) is drawn as a textured card. The mesh is rendered once
+    from `views` directions around its model y axis, each into a tile of a
+    shared atlas; the card turns about that axis to face the camera and
+    shows the tile baked closest to the current view direction, so meshes
+    look right from the side and back and never go edge-on. Views from
+    steeply above or below are approximated by the nearest side view.
+    Meshes with the same `impostor_key` (same shape relative to their
+    bounds, same colors) share tiles, and a color change simply maps to
+    another key. Every card goes out in a single instanced draw. The
+    switch has a `hysteresis` band, a fraction of `switch_pixels` either
+    side of it, so meshes near the threshold do not pop back and forth.
+
+    Savings are estimated from the measured per-mesh cost of the full pass
+    (CPU from wall time, GPU from timer queries of the previous frame)
+    minus the cost of the impostor pass.
+    """
+
+    def __init__(
+        self,
+        ctx,
+        switch_pixels=12.0,
+        hysteresis=0.25,
+        atlas_size=2048,
+        tile_size=32,
+        max_bakes_per_frame=64,
+        views=8,
+    ):
+        self.ctx = ctx
+        self.views = views
+        self.switch_pixels = switch_pixels
+        self.hysteresis = hysteresis
+        self.tile_size = tile_size
+        self.tiles_per_row = atlas_size // tile_size
+        self.max_tiles = self.tiles_per_row * self.tiles_per_row
+        self.max_bakes_per_frame = max_bakes_per_frame
+
+        self.atlas = ctx.texture((atlas_size, atlas_size), 4)
+        self.atlas.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.atlas_depth = ctx.depth_renderbuffer((atlas_size, atlas_size))
+        self.atlas_fbo = ctx.framebuffer(
+            color_attachments=[self.atlas], depth_attachment=self.atlas_depth
+        )
+        self.atlas_size = atlas_size
+
+        self.program = ctx.program(vertex_shader=_IMPOSTOR_VS, fragment_shader=_IMPOSTOR_FS)
+        corners = [-1, -1, 1, -1, 1, 1, -1, -1, 1, 1, -1, 1]
+        self.corner_vbo = ctx.buffer(struct.pack(f"{len(corners)}f", *corners))
+        self.instance_capacity = 0
+        self.instance_vbo = None
+        self.vao = None
+
+        self.full_query = ctx.query(time=True)
+        self.impostor_query = ctx.query(time=True)
+        self._queries_pending = False
+
+        self.impostor_state = {}
+        self.tiles = {}
+        self.mesh_tiles = {}
+        self.next_tile = 0
+        self.instances = []
+        self.stats = LodStats()
+        self.last_stats = self.stats
+        self._bakes_left = max_bakes_per_frame
+        self._cpu_per_mesh = 0.0
+        self._gpu_per_mesh = 0.0
+        self._last_impostor_gpu = 0.0
+
+    def begin_frame(self, viewport_height, focal, eye):
+        if self._queries_pending:
+            # Last frame has been presented, so these rarely block. Its
+            # counts are still in `self.stats` until the swap below.
+            measured = self.stats
+            if measured.full:
+                self._gpu_per_mesh = self.full_query.elapsed / 1e6 / measured.full
+            self._last_impostor_gpu = (
+                self.impostor_query.elapsed / 1e6 if measured.impostors else 0.0
+            )
+            self._queries_pending = False
+
+        self.last_stats = self.stats
+        self.stats = LodStats()
+        self.instances = []
+        self._bakes_left = self.max_bakes_per_frame
+        self.viewport_height = viewport_height
+        self.focal = focal
+        self.eye = eye
+
+    def use_impostor(self, mesh, model, mvp):
+        """Queue `mesh` as an impostor and return True, or False to draw it fully."""
+        if not getattr(mesh, "supports_impostor", False) or mesh.bounds is None:
+            self.stats.full += 1
+            return False
+
+        min_x, min_y, min_z, max_x, max_y, max_z = mesh.bounds
+        cx = (min_x + max_x) * 0.5
+        cy = (min_y + max_y) * 0.5
+        cz = (min_z + max_z) * 0.5
+        w = transform_point(mvp, cx, cy, cz)[3]
+
+        # World-space radius from the model-space half diagonal and the
+        # largest axis scale of the model matrix.
+        scale = max(
+            math.sqrt(model[0] ** 2 + model[1] ** 2 + model[2] ** 2),
+            math.sqrt(model[4] ** 2 + model[5] ** 2 + model[6] ** 2),
+            math.sqrt(model[8] ** 2 + model[9] ** 2 + model[10] ** 2),
+        )
+        radius = 0.5 * scale * math.sqrt(
+            (max_x - min_x) ** 2 + (max_y - min_y) ** 2 + (max_z - min_z) ** 2
+        )
+
+        key = id(mesh)
+        was_impostor = self.impostor_state.get(key, False)
+        if w <= 1e-6:
+            wants_impostor = False
+        else:
+            pixels = 2.0 * radius * self.focal / w * self.viewport_height * 0.5
+            if was_impostor:
+                wants_impostor = pixels < self.switch_pixels * (1.0 + self.hysteresis)
+            else:
+                wants_impostor = pixels < self.switch_pixels * (1.0 - self.hysteresis)
+
+        uv_rects = None
+        if wants_impostor:
+            uv_rects = self._tiles_for(mesh)
+            if uv_rects is None:
+                wants_impostor = False
+
+        if wants_impostor != was_impostor:
+            self.impostor_state[key] = wants_impostor
+            self.stats.switches += 1
+
+        if not wants_impostor:
+            self.stats.full += 1
+            return False
+
+        # Azimuth of the eye around the mesh, in model space (exact for
+        # rotation plus scale, which is all model matrices here carry).
+        center = transform_point(model, cx, cy, cz)[:3]
+        vx = self.eye[0] - center[0]
+        vy = self.eye[1] - center[1]
+        vz = self.eye[2] - center[2]
+        to_x = (vx * model[0] + vy * model[1] + vz * model[2]) / (
+            model[0] ** 2 + model[1] ** 2 + model[2] ** 2
+        )
+        to_z = (vx * model[8] + vy * model[9] + vz * model[10]) / (
+            model[8] ** 2 + model[9] ** 2 + model[10] ** 2
+        )
+        azimuth = math.atan2(to_x, to_z)
+        view = int(round(azimuth / (2.0 * math.pi) * self.views)) % self.views
+
+        # The card spans the bounds' xz circle across and its height up.
+        half_width = 0.5 * math.sqrt((max_x - min_x) ** 2 + (max_z - min_z) ** 2)
+        ux = math.cos(azimuth) * half_width
+        uz = -math.sin(azimuth) * half_width
+        hy = (max_y - min_y) * 0.5
+        self.instances.extend(center)
+        self.instances.extend(
+            (
+                model[0] * ux + model[8] * uz,
+                model[1] * ux + model[9] * uz,
+                model[2] * ux + model[10] * uz,
+            )
+        )
+        self.instances.extend((model[4] * hy, model[5] * hy, model[6] * hy))
+        self.instances.extend(uv_rects[view])
+        self.stats.impostors += 1
+        return True
+
+    def _tiles_for(self, mesh):
+        """Atlas rects of the mesh's baked views, baking them on first use."""
+        key = mesh.impostor_key()
+        # Keys are full geometry tuples (so distinct shapes never share
+        # tiles) and tuples do not cache their hash; remember each mesh's
+        # tiles by key identity so the dict is only hashed on a change.
+        cached = self.mesh_tiles.get(id(mesh))
+        if cached is not None and cached[0] is key:
+            return cached[1]
+        uv_rects = self.tiles.get(key)
+        if uv_rects is not None:
+            self.mesh_tiles[id(mesh)] = (key, uv_rects)
+            return uv_rects
+        if self._bakes_left < self.views or self.next_tile + self.views > self.max_tiles:
+            return None
+
+        min_x, min_y, min_z, max_x, max_y, max_z = mesh.bounds
+        if max_y - min_y <= 0.0 or (max_x - min_x <= 0.0 and max_z - min_z <= 0.0):
+            return None
+        uv_rects = [
+            self._bake(mesh, self.next_tile + view, 2.0 * math.pi * view / self.views)
+            for view in range(self.views)
+        ]
+        self.next_tile += self.views
+        self.tiles[key] = uv_rects
+        self.mesh_tiles[id(mesh)] = (key, uv_rects)
+        self._bakes_left -= self.views
+        self.stats.baked += self.views
+        return uv_rects
+
+    def _bake(self, mesh, tile, azimuth):
+        """Render `mesh` as seen from `azimuth` around its model y axis."""
+        min_x, min_y, min_z, max_x, max_y, max_z = mesh.bounds
+        cx = (min_x + max_x) * 0.5
+        cz = (min_z + max_z) * 0.5
+        half_width = 0.5 * math.sqrt((max_x - min_x) ** 2 + (max_z - min_z) ** 2)
+        # Flat meshes have no depth extent; pad so the projection is valid.
+        depth = half_width + max(1e-4, half_width * 0.01)
+        proj = orthographic(-half_width, half_width, min_y, max_y, -depth, depth)
+        # rotation_y(a) maps the direction (sin a, 0, cos a) onto +z, so the
+        # camera looks back at the mesh from that direction.
+        mvp = mat4_mul(proj, mat4_mul(rotation_y(azimuth), translate(-cx, 0.0, -cz)))
+
+        size = self.tile_size
+        tx = (tile % self.tiles_per_row) * size
+        ty = (tile // self.tiles_per_row) * size
+
+        previous_fbo = self.ctx.fbo
+        self.atlas_fbo.use()
+        self.atlas_fbo.viewport = (tx, ty, size, size)
+        self.atlas_fbo.clear(0.0, 0.0, 0.0, 0.0, viewport=(tx, ty, size, size))
+        mesh.program["mvp"].write(struct.pack("16f", *mvp))
+        mesh.draw()
+        previous_fbo.use()
+
+        # Inset by half a texel so linear filtering never reads a neighbour.
+        half = 0.5 / self.atlas_size
+        span = size / self.atlas_size
+        return (tx / self.atlas_size + half, ty / self.atlas_size + half, span - 2 * half, span - 2 * half)
+
+    def flush_full(self, render_queue):
+        """Submit the full-detail queue, timing it for the savings estimate."""
+        start = time.perf_counter()
+        with self.full_query:
+            render_queue.flush()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        if self.stats.full:
+            self._cpu_per_mesh = elapsed / self.stats.full
+
+    def draw_impostors(self, view_proj):
+        start = time.perf_counter()
+        count = self.stats.impostors
+        with self.impostor_query:
+            if count:
+                self._upload_instances()
+                self.atlas.use(location=0)
+                self.program["atlas"].value = 0
+                self.program["view_proj"].write(struct.pack("16f", *view_proj))
+                self.vao.render(moderngl.TRIANGLES, vertices=6, instances=count)
+        self._queries_pending = True
+        impostor_cpu = (time.perf_counter() - start) * 1000.0 if count else 0.0
+
+        self.stats.cpu_saved_ms = max(0.0, self._cpu_per_mesh * count - impostor_cpu)
+        self.stats.gpu_saved_ms = max(
+            0.0, self._gpu_per_mesh * count - self._last_impostor_gpu
+        )
+
+    def _upload_instances(self):
+        count = len(self.instances) // _INSTANCE_FLOATS
+        if count > self.instance_capacity:
+            self.instance_capacity = max(count, self.instance_capacity * 2, 64)
+            if self.instance_vbo is not None:
+                self.vao.release()
+                self.instance_vbo.release()
+            self.instance_vbo = self.ctx.buffer(
+                reserve=self.instance_capacity * _INSTANCE_FLOATS * 4, dynamic=True
+            )
+            self.vao = self.ctx.vertex_array(
+                self.program,
+                [
+                    (self.corner_vbo, "2f", "in_corner"),
+                    (
+                        self.instance_vbo,
+                        "3f 3f 3f 4f/i",
+                        "in_center",
+                        "in_axis_u",
+                        "in_axis_v",
+                        "in_uv_rect",
+                    ),
+                ],
+            )
+        self.instance_vbo.write(struct.pack(f"{len(self.instances)}f", *self.instances))
@@ -2,67 +2,97 @@ import math
 
 import glfw
 
+from frame_pipeline import FramePipeline, FrameDescription
 from mainrenderapi import Renderer, ConcreteWorldGen
 from mathhelpers import get_camera_forward, get_camera_right
+from occlusion import HeightPyramid, OcclusionCuller
 import numpy as np
 
 
 def main():
     renderer = Renderer(1600, 1000, "Perlin World")
 
-    worldgen = ConcreteWorldGen()
+    gpu_worldgen = renderer.create_world_gen_backend()
+    worldgen = ConcreteWorldGen(height_backend=gpu_worldgen)
     world_w = 320
     world_d = 320
     height_scale = 120.0
 
-    heights, world_w, world_d = worldgen.generate_world_heights(
-        width=world_w,
-        depth=world_d,
-        noise_scale=0.0015,
-        seed=1337,
-    )
-
-    vertices = []
-    indices = []
-    colors = []
-
-    x_offset = -world_w / 2.0
-    z_offset = -world_d / 2.0
-
-    for z in range(world_d + 1):
-        for x in range(world_w + 1):
-            h = heights[z][x]
-            y = (h - 0.45) * height_scale
-            vertices.extend(
-                [
-                    x + x_offset,
-                    y,
-                    z + z_offset,
-                ]
-            )
-
-    stride = world_w + 1
-    ground_heights = []
-    for z in range(world_d):
-        row = []
-        for x in range(world_w):
-            i0 = z * stride + x
-            i1 = i0 + 1
-            i2 = i0 + stride
-            i3 = i2 + 1
-
-            indices.extend([i0, i1, i2])
-            indices.extend([i1, i3, i2])
-
-            h1 = heights[z][x]
-            h2 = heights[z][x + 1]
-            h3 = heights[z + 1][x]
-            h4 = heights[z + 1][x + 1]
-            row.append(h1)
-            colors.append(worldgen.height_color((h1 + h2 + h3) / 3.0))
-            colors.append(worldgen.height_color((h2 + h3 + h4) / 3.0))
-        ground_heights.append(row)
-    mesh = renderer.create_mesh(vertices, indices, colors)
+    # "instanced" draws the terrain from a height texture and one reusable
+    # grid patch; "mesh" bakes every vertex and triangle color on the CPU.
+    terrain_mode = "instanced"
+
+    # With the GPU backend the heightmap is rendered once; the texture feeds
+    # the terrain and the CPU copy feeds colors and collision.
+    heights_tex = None
+    if gpu_worldgen.available:
+        heights_tex = gpu_worldgen.generate_height_texture(
+            width=world_w, depth=world_d, noise_scale=0.0015, seed=1337
+        )
+        heights = gpu_worldgen.read_heights(heights_tex)
+    else:
+        heights, world_w, world_d = worldgen.generate_world_heights(
+            width=world_w,
+            depth=world_d,
+            noise_scale=0.0015,
+            seed=1337,
+        )
+
+    if terrain_mode == "instanced":
+        mesh = renderer.create_terrain(
+            heights_tex if heights_tex is not None else heights,
+            world_w,
+            world_d,
+            height_scale,
+        )
+        ground_heights = [row[:world_w] for row in heights[:world_d]]
+    else:
+        vertices = []
+        indices = []
+        colors = []
+
+        x_offset = -world_w / 2.0
+        z_offset = -world_d / 2.0
+
+        if heights_tex is not None:
+            # Positions are derived on the GPU; `heights` is still needed on
+            # the CPU for colors and the height sampler.
+            vertices = gpu_worldgen.build_vertex_buffer(heights_tex, height_scale)
+        else:
+            for z in range(world_d + 1):
+                for x in range(world_w + 1):
+                    h = heights[z][x]
+                    y = (h - 0.45) * height_scale
+                    vertices.extend(
+                        [
+                            x + x_offset,
+                            y,
+                            z + z_offset,
+                        ]
+                    )
+
+        stride = world_w + 1
+        ground_heights = []
+        for z in range(world_d):
+            row = []
+            for x in range(world_w):
+                i0 = z * stride + x
+                i1 = i0 + 1
+                i2 = i0 + stride
+                i3 = i2 + 1
+
+                indices.extend([i0, i1, i2])
+                indices.extend([i1, i3, i2])
+
+                h1 = heights[z][x]
+                h2 = heights[z][x + 1]
+                h3 = heights[z + 1][x]
+                h4 = heights[z + 1][x + 1]
+                row.append(h1)
+                colors.append(worldgen.height_color((h1 + h2 + h3) / 3.0))
+                colors.append(worldgen.height_color((h2 + h3 + h4) / 3.0))
+            ground_heights.append(row)
+        mesh = renderer.create_mesh(vertices, indices, colors)
     mesh.set_model_matrix(
         [
             1,
@@ -110,10 +140,18 @@ def main():
         heights, world_w, world_d, height_scale
     )
 
+    # Terrain occlusion culling costs a few ms of CPU per moving frame and
+    # only hides cheap instanced patches here, so it is opt-in; enable it
+    # for scenes with many meshes behind hills.
+    occlusion_culling = False
+    if occlusion_culling:
+        renderer.set_occlusion_culler(
+            OcclusionCuller(HeightPyramid(heights, world_w, world_d, height_scale))
+        )
+
     cursor_locked = True
     renderer.set_cursor_locked(cursor_locked)
 
-    last_time = glfw.get_time()
     input_state = renderer.get_input()
     last_mouse = input_state.get_mouse_position()
 
@@ -137,41 +175,39 @@ def main():
     start_ground = sample_height(start_x, start_z)
     if start_ground is None:
         start_ground = 0.0
-    renderer.set_camera_position(start_x, start_ground + player_height, start_z)
-    renderer.set_camera_rotation(-0.35, 0.75)
+    cam_x, cam_y, cam_z = start_x, start_ground + player_height, start_z
+    pitch, yaw = -0.35, 0.75
+    renderer.set_camera_position(cam_x, cam_y, cam_z)
+    renderer.set_camera_rotation(pitch, yaw)
 
     fps_accum = 0.0
     fps_frames = 0
 
-    while not glfw.window_should_close(renderer.window):
-        now = glfw.get_time()
-        dt = now - last_time
-        last_time = now
-
-        input_state = renderer.get_input()
+    # Runs on the game thread: simulate one tick and describe the frame.
+    # GLFW window calls (cursor mode, title) go through the frame
+    # description so they happen on the render thread.
+    def update(dt):
+        nonlocal cursor_locked, last_mouse, pitch, yaw
+        nonlocal cam_x, cam_y, cam_z, vel_x, vel_y, vel_z
+        nonlocal fps_accum, fps_frames
 
         if input_state.is_key_pressed(glfw.KEY_ESCAPE):
             cursor_locked = False
-            renderer.set_cursor_locked(cursor_locked)
         if input_state.is_mouse_button_pressed(glfw.MOUSE_BUTTON_LEFT):
             cursor_locked = True
-            renderer.set_cursor_locked(cursor_locked)
 
         mouse_x, mouse_y = input_state.get_mouse_position()
         if cursor_locked:
             dx = mouse_x - last_mouse[0]
             dy = mouse_y - last_mouse[1]
-            pitch, yaw = renderer.get_camera_rotation()
             yaw += dx * mouse_sensitivity
             if invert_mouse_y:
                 pitch += dy * mouse_sensitivity
             else:
                 pitch -= dy * mouse_sensitivity
-            pitch_clipped = np.clip(pitch, -1.57, 1.57)
-            renderer.set_camera_rotation(pitch_clipped, yaw)
+            pitch = float(np.clip(pitch, -1.57, 1.57))
         last_mouse = (mouse_x, mouse_y)
 
-        pitch, yaw = renderer.get_camera_rotation()
         forward = get_camera_forward(pitch, yaw)
         right = get_camera_right(pitch, yaw)
 
@@ -195,8 +231,6 @@ def main():
             move_x /= length
             move_z /= length
 
-        cam_x, cam_y, cam_z = renderer.get_camera_position()
-
         # Desired horizontal velocity
         target_vx = move_x * move_speed
         target_vz = move_z * move_speed
@@ -237,33 +271,40 @@ def main():
                 if vel_y < 0:
                     vel_y = 0.0
                 grounded = True
-            if grounded and (
-                input_state.is_key_pressed(glfw.KEY_SPACE)
-                or glfw.get_key(renderer.window, glfw.KEY_SPACE) == glfw.PRESS
-            ):
+            if grounded and input_state.is_key_pressed(glfw.KEY_SPACE):
                 vel_y += jump_speed * dt * -gravity
         cam_y = ground_heights[int(cam_z)][int(cam_x)] + player_height + vel_y
-        renderer.set_camera_position(cam_x, cam_y, cam_z)
-
-        renderer.run()
 
+        title = None
         fps_accum += dt
         fps_frames += 1
         if fps_accum >= 0.5:
             fps = fps_frames / fps_accum
-            cam_x, cam_y, cam_z = renderer.get_camera_position()
-            pitch, yaw = renderer.get_camera_rotation()
             pitch_deg = math.degrees(pitch)
             yaw_deg = math.degrees(yaw)
-            glfw.set_window_title(
-                renderer.window,
+            title = (
                 f"Perlin World - {fps:.1f} FPS | "
                 f"Pos x:{cam_x:.2f} y:{cam_y:.2f} z:{cam_z:.2f} | "
-                f"Pitch:{pitch_deg:.1f} Yaw:{yaw_deg:.1f}",
+                f"Pitch:{pitch_deg:.1f} Yaw:{yaw_deg:.1f}"
             )
+            cull_stats = pipeline.feedback.cull
+            if cull_stats is not None:
+                title += f" | Occluded:{cull_stats.culled}/{cull_stats.tested}"
             fps_accum = 0.0
             fps_frames = 0
 
+        return FrameDescription(
+            camera_pos=(cam_x, cam_y, cam_z),
+            camera_rotation=(pitch, yaw),
+            cursor_locked=cursor_locked,
+            title=title,
+        )
+
+    pipeline = FramePipeline(renderer, update)
+    try:
+        pipeline.run()
+    finally:
+        renderer.close()
 
 if __name__ == "__main__":
     main()
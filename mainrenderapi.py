@@ -1,9 +1,34 @@
 #from api_defs import Mesh, Renderer, InputState
-from renderer_impl import ConcreteMesh, ConcreteRenderer, ConcreteInputState
-from worldapi import ConcreteWorldGen
-
-# Expose concrete implementations as the API
-Mesh = ConcreteMesh
-Renderer = ConcreteRenderer
-InputState = ConcreteInputState
-WorldGen = ConcreteWorldGen
\ No newline at end of file
+import importlib
+
+# Public name -> (module, attribute). Backends are imported on first access
+# so that world generation and math users never load glfw/moderngl.
+_EXPORTS = {
+    "Mesh": ("renderer_impl", "ConcreteMesh"),
+    "Renderer": ("renderer_impl", "ConcreteRenderer"),
+    "InputState": ("renderer_impl", "ConcreteInputState"),
+    "ConcreteMesh": ("renderer_impl", "ConcreteMesh"),
+    "ConcreteRenderer": ("renderer_impl", "ConcreteRenderer"),
+    "ConcreteInputState": ("renderer_impl", "ConcreteInputState"),
+    "WorldGen": ("worldapi", "ConcreteWorldGen"),
+    "ConcreteWorldGen": ("worldapi", "ConcreteWorldGen"),
+    "SpatialHash": ("spatialapi", "ConcreteSpatialHash"),
+    "ConcreteSpatialHash": ("spatialapi", "ConcreteSpatialHash"),
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module_name, attr = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name), attr)
+    # Cache so later lookups skip __getattr__ entirely.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
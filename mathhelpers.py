@@ -17,6 +17,14 @@ def perspective(fovy, aspect, near, far):
         0, 0, (2 * far * near) / (near - far), 0,
     ]
 
+def orthographic(left, right, bottom, top, near, far):
+    return [
+        2.0 / (right - left), 0, 0, 0,
+        0, 2.0 / (top - bottom), 0, 0,
+        0, 0, -2.0 / (far - near), 0,
+        -(right + left) / (right - left), -(top + bottom) / (top - bottom), -(far + near) / (far - near), 1,
+    ]
+
 def rotation_y(angle):
     c = math.cos(angle)
     s = math.sin(angle)
@@ -52,6 +60,28 @@ def mat4_mul(a, b):
         for row in range(4)
     ]
 
+def transform_point(m, x, y, z):
+    """Multiply the point (x, y, z, 1) by a column-major mat4; returns (x, y, z, w)."""
+    return (
+        m[0] * x + m[4] * y + m[8] * z + m[12],
+        m[1] * x + m[5] * y + m[9] * z + m[13],
+        m[2] * x + m[6] * y + m[10] * z + m[14],
+        m[3] * x + m[7] * y + m[11] * z + m[15],
+    )
+
+def transform_bounds(m, bounds):
+    """World-space AABB of a model-space AABB under a column-major mat4."""
+    min_x, min_y, min_z, max_x, max_y, max_z = bounds
+    xs, ys, zs = [], [], []
+    for x in (min_x, max_x):
+        for y in (min_y, max_y):
+            for z in (min_z, max_z):
+                px, py, pz, _ = transform_point(m, x, y, z)
+                xs.append(px)
+                ys.append(py)
+                zs.append(pz)
+    return (min(xs), min(ys), min(zs), max(xs), max(ys), max(zs))
+
 def get_camera_forward(pitch, yaw):
     """Get forward direction vector from pitch and yaw angles."""
     return (
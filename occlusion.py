@@ -0,0 +1,343 @@
+import bisect
+import math
+
+import numpy as np
+
+from worldapi import maked_height_sampler
+
+
+class HeightPyramid:
+    """Min/max height pyramid over a `generate_world_heights` grid.
+
+    Level 0 holds `leaf_size` x `leaf_size` cell blocks; each level above
+    merges 2x2 blocks of the one below until a single node remains. Heights
+    are stored in world units using the same mapping as the terrain mesh and
+    `make_height_sampler`, and assume the terrain is drawn with an identity
+    model matrix.
+    """
+
+    def __init__(self, heights, width, depth, height_scale, leaf_size=8):
+        self.heights = heights
+        self.width = width
+        self.depth = depth
+        self.height_scale = height_scale
+        self.leaf_size = leaf_size
+        self.sample_height = maked_height_sampler(heights, width, depth, height_scale)
+
+        leaves = []
+        for z0 in range(0, depth, leaf_size):
+            row = []
+            for x0 in range(0, width, leaf_size):
+                row.append(self._region_min_max(x0, z0, x0 + leaf_size, z0 + leaf_size))
+            leaves.append(row)
+        self.levels = [leaves]
+
+        while len(self.levels[-1]) > 1 or len(self.levels[-1][0]) > 1:
+            below = self.levels[-1]
+            level = []
+            for j in range(0, len(below), 2):
+                row = []
+                for i in range(0, len(below[0]), 2):
+                    children = [
+                        below[cj][ci]
+                        for cj in (j, j + 1)
+                        for ci in (i, i + 1)
+                        if cj < len(below) and ci < len(below[0])
+                    ]
+                    row.append(
+                        (min(c[0] for c in children), max(c[1] for c in children))
+                    )
+                level.append(row)
+            self.levels.append(level)
+
+        self.min_height, self.max_height = self.levels[-1][0][0]
+
+    def _region_min_max(self, x0, z0, x1, z1):
+        x1 = min(x1, self.width)
+        z1 = min(z1, self.depth)
+        lo = hi = self.heights[z0][x0]
+        for z in range(z0, z1 + 1):
+            row = self.heights[z]
+            for x in range(x0, x1 + 1):
+                h = row[x]
+                if h < lo:
+                    lo = h
+                elif h > hi:
+                    hi = h
+        return ((lo - 0.45) * self.height_scale, (hi - 0.45) * self.height_scale)
+
+    def region_bounds(self, x0, z0, x1, z1):
+        """World AABB of the terrain surface over grid cells [x0, x1) x [z0, z1)."""
+        lo, hi = self._region_min_max(x0, z0, x1, z1)
+        x1 = min(x1, self.width)
+        z1 = min(z1, self.depth)
+        return (
+            x0 - self.width / 2.0, lo, z0 - self.depth / 2.0,
+            x1 - self.width / 2.0, hi, z1 - self.depth / 2.0,
+        )
+
+    def node_footprint(self, level, i, j):
+        size = self.leaf_size << level
+        x0 = i * size
+        z0 = j * size
+        x1 = min(x0 + size, self.width)
+        z1 = min(z0 + size, self.depth)
+        return (
+            x0 - self.width / 2.0, z0 - self.depth / 2.0,
+            x1 - self.width / 2.0, z1 - self.depth / 2.0,
+        )
+
+
+def _rect_view(ex, ez, x0, z0, x1, z1):
+    """Azimuth span and nearest/farthest horizontal distance of a rectangle.
+
+    Returns None when the eye lies inside the rectangle, where no azimuth
+    span exists.
+    """
+    if x0 <= ex <= x1 and z0 <= ez <= z1:
+        return None
+    nx = min(max(ex, x0), x1) - ex
+    nz = min(max(ez, z0), z1) - ez
+    d_min = math.sqrt(nx * nx + nz * nz)
+
+    center = math.atan2((z0 + z1) * 0.5 - ez, (x0 + x1) * 0.5 - ex)
+    lo = hi = 0.0
+    d_max = 0.0
+    for cx, cz in ((x0, z0), (x1, z0), (x0, z1), (x1, z1)):
+        dx = cx - ex
+        dz = cz - ez
+        d = dx * dx + dz * dz
+        if d > d_max:
+            d_max = d
+        # Corner azimuth relative to the centre, wrapped into [-pi, pi].
+        delta = (math.atan2(dz, dx) - center + math.pi) % (2.0 * math.pi) - math.pi
+        if delta < lo:
+            lo = delta
+        elif delta > hi:
+            hi = delta
+    return center + lo, center + hi, d_min, math.sqrt(d_max)
+
+
+def _rect_views(ex, ez, rects):
+    """`_rect_view` for an (N, 4) array of rectangles (x0, z0, x1, z1).
+
+    Returns a mask of the rectangles the eye is outside of and, for those,
+    arrays of azimuth start/end and nearest/farthest distance.
+    """
+    x0, z0, x1, z1 = rects.T
+    outside = ~((x0 <= ex) & (ex <= x1) & (z0 <= ez) & (ez <= z1))
+    x0, z0, x1, z1 = x0[outside], z0[outside], x1[outside], z1[outside]
+
+    nx = np.clip(ex, x0, x1) - ex
+    nz = np.clip(ez, z0, z1) - ez
+    d_min = np.sqrt(nx * nx + nz * nz)
+    center = np.arctan2((z0 + z1) * 0.5 - ez, (x0 + x1) * 0.5 - ex)
+    corner_x = np.stack([x0, x1, x0, x1]) - ex
+    corner_z = np.stack([z0, z0, z1, z1]) - ez
+    d_max = np.sqrt((corner_x * corner_x + corner_z * corner_z).max(axis=0))
+    delta = (np.arctan2(corner_z, corner_x) - center + math.pi) % (2.0 * math.pi) - math.pi
+    a0 = center + np.minimum(delta.min(axis=0), 0.0)
+    a1 = center + np.maximum(delta.max(axis=0), 0.0)
+    return outside, a0, a1, d_min, d_max
+
+
+def _expand_bins(first, last, bins):
+    """(owner, bin) pairs for every index range [first, last], wrapped."""
+    counts = np.maximum(last - first + 1, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, (first[owner] + np.arange(len(owner)) - offsets) % bins
+
+
+class OcclusionStats:
+    def __init__(self):
+        self.occluders = 0
+        self.tested = 0
+        self.culled = 0
+
+    def __repr__(self):
+        return (
+            f"OcclusionStats(occluders={self.occluders}, tested={self.tested}, "
+            f"culled={self.culled})"
+        )
+
+
+class OcclusionCuller:
+    """Hides boxes that lie entirely behind the terrain.
+
+    Each pyramid node at `level` stands for a solid column: the block
+    between its minimum surface height and the ground beneath it is always
+    inside the terrain. `begin_frame` rasterizes those columns into an
+    occlusion horizon around the eye: per azimuth bin, a staircase of the
+    highest elevation (as a slope) that is blocked beyond a given distance.
+    Column footprints only fill bins they cover completely, and slopes are
+    taken at the footprint edge that makes them lowest, so a box is culled
+    only when every sight line to it passes through a column nearer than
+    the box itself. The horizon is built with numpy over all columns at
+    once, since the camera moves nearly every frame.
+    """
+
+    def __init__(self, pyramid, level=0, bins=512):
+        self.pyramid = pyramid
+        self.level = level
+        self.bins = bins
+        self.eye = None
+        self.solid_below = True
+        self.stats = OcclusionStats()
+        self.last_stats = self.stats
+        self._distances = []
+        self._slopes = []
+        self._bin_starts = [0] * (bins + 1)
+        self._span = 1.0
+        self._horizon_keys = np.empty(0, dtype=np.float64)
+        self._horizon_slopes = np.empty(0, dtype=np.float64)
+        self._terrain_patch_bounds = {}
+
+        nodes = pyramid.levels[level]
+        footprints = [
+            pyramid.node_footprint(level, i, j)
+            for j, row in enumerate(nodes)
+            for i in range(len(row))
+        ]
+        self._footprints = np.array(footprints, dtype=np.float64).reshape(-1, 4)
+        self._node_heights = np.array(
+            [node for row in nodes for node in row], dtype=np.float64
+        ).reshape(-1, 2)
+
+    def _bin(self, azimuth):
+        return int(math.floor((azimuth + math.pi) / (2.0 * math.pi) * self.bins))
+
+    def begin_frame(self, eye):
+        occluders = self.stats.occluders
+        self.last_stats = self.stats
+        self.stats = OcclusionStats()
+        # The horizon depends only on the eye position, not the view
+        # direction, so a stationary camera reuses the previous one.
+        if eye == self.eye and occluders:
+            self.stats.occluders = occluders
+            return
+        self.eye = eye
+        ex, ey, ez = eye
+
+        # The solid side is whichever side of the surface the eye is not on.
+        # When it is above, heights are mirrored so the rest of the code only
+        # deals with terrain that is solid below its surface.
+        surface = self.pyramid.sample_height(ex, ez)
+        if surface is None:
+            surface = (self.pyramid.min_height + self.pyramid.max_height) * 0.5
+        self.solid_below = ey >= surface
+
+        outside, a0, a1, d_min, d_max = _rect_views(ex, ez, self._footprints)
+        lo, hi = self._node_heights[outside].T
+
+        rise = (lo - ey) if self.solid_below else (ey - hi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(rise > 0.0, rise / d_max, rise / d_min)
+        self.stats.occluders = len(d_max)
+
+        order = np.lexsort((slope, d_max))
+        d_max, slope, a0, a1 = d_max[order], slope[order], a0[order], a1[order]
+
+        # Expand each column into the bins it covers completely.
+        scale = self.bins / (2.0 * math.pi)
+        first = np.ceil((a0 + math.pi) * scale).astype(np.int64)
+        last = np.floor((a1 + math.pi) * scale).astype(np.int64) - 1
+        column, bins = _expand_bins(first, last, self.bins)
+
+        # Within each bin (columns nearest first) keep only the entries that
+        # raise the horizon: a running maximum over dense slope ranks,
+        # offset per bin so one accumulate covers every bin.
+        entry = np.lexsort((column, bins))
+        bins = bins[entry]
+        column = column[entry]
+        _, rank = np.unique(slope[column], return_inverse=True)
+        key = bins * (len(d_max) + 1) + rank.reshape(-1)
+        previous = np.maximum.accumulate(key)
+        keep = np.ones(len(key), dtype=bool)
+        keep[1:] = (key[1:] > previous[:-1]) | (bins[1:] != bins[:-1])
+        bins = bins[keep]
+        column = column[keep]
+
+        self._bin_starts = np.searchsorted(bins, np.arange(self.bins + 1)).tolist()
+        self._distances = d_max[column].tolist()
+        self._slopes = slope[column].tolist()
+        # Bin-major sort key over every staircase, for batched lookups.
+        # Rounding is monotonic, so it can only drop occluders at equal
+        # distances, never add them.
+        self._span = float(d_max.max()) + 1.0 if len(d_max) else 1.0
+        self._horizon_keys = bins * self._span + d_max[column]
+        self._horizon_slopes = slope[column]
+
+    def is_occluded(self, bounds):
+        self.stats.tested += 1
+        ex, ey, ez = self.eye
+        min_x, min_y, min_z, max_x, max_y, max_z = bounds
+        view = _rect_view(ex, ez, min_x, min_z, max_x, max_z)
+        if view is None:
+            return False
+        a0, a1, d_min, d_max = view
+        if d_min <= 0.0:
+            return False
+
+        rise = (max_y - ey) if self.solid_below else (ey - min_y)
+        slope = rise / d_min if rise > 0.0 else rise / d_max
+
+        distances = self._distances
+        starts = self._bin_starts
+        for b in range(self._bin(a0), self._bin(a1) + 1):
+            b %= self.bins
+            # Only columns entirely nearer than the box can hide it.
+            start = starts[b]
+            k = bisect.bisect_left(distances, d_min, start, starts[b + 1])
+            if k == start or self._slopes[k - 1] <= slope:
+                return False
+        self.stats.culled += 1
+        return True
+
+    def occluded(self, bounds):
+        """Vectorized `is_occluded` for an (N, 6) array of boxes; returns a mask."""
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        ex, ey, ez = self.eye
+        result = np.zeros(len(bounds), dtype=bool)
+        self.stats.tested += len(bounds)
+
+        outside, a0, a1, d_min, d_max = _rect_views(ex, ez, bounds[:, [0, 2, 3, 5]])
+        candidates = np.flatnonzero(outside)
+        if not len(candidates) or not len(self._horizon_keys):
+            return result
+        boxes = bounds[candidates]
+        rise = (boxes[:, 4] - ey) if self.solid_below else (ey - boxes[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(rise > 0.0, rise / d_min, rise / d_max)
+
+        scale = self.bins / (2.0 * math.pi)
+        first = np.floor((a0 + math.pi) * scale).astype(np.int64)
+        last = np.floor((a1 + math.pi) * scale).astype(np.int64)
+        box, bins = _expand_bins(first, last, self.bins)
+
+        # Nearest horizon step strictly nearer than the box, per (box, bin).
+        k = np.searchsorted(self._horizon_keys, bins * self._span + d_min[box], side="left")
+        starts = np.asarray(self._bin_starts)[bins]
+        blocked = (k > starts) & (self._horizon_slopes[np.maximum(k - 1, 0)] > slope[box])
+        # A box is hidden only if every bin it touches is blocked.
+        open_bins = np.bincount(box, weights=~blocked, minlength=len(candidates))
+        hidden = (open_bins == 0) & (d_min > 0.0)
+        result[candidates[hidden]] = True
+        self.stats.culled += int(hidden.sum())
+        return result
+
+    def visible_terrain_patches(self, terrain):
+        """Origins of the terrain patches not hidden behind other terrain."""
+        patches = self._terrain_patch_bounds.get(id(terrain))
+        if patches is None:
+            size = terrain.patch_size
+            origins = list(terrain.patch_origins)
+            bounds = np.array(
+                [self.pyramid.region_bounds(px, pz, px + size, pz + size) for px, pz in origins],
+                dtype=np.float64,
+            )
+            patches = (origins, bounds)
+            self._terrain_patch_bounds[id(terrain)] = patches
+        origins, bounds = patches
+        hidden = self.occluded(bounds)
+        return [origin for origin, h in zip(origins, hidden) if not h]
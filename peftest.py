@@ -82,6 +82,14 @@ def run_performance_test():
     fps5 = (renderer.run_frames(10) + 100)
     print(f"FPS with 3251 meshes (6502 triangles total): {fps5:.2f}")
 
+    # Test 6: Same scene with distant meshes drawn as impostors
+    print("\nTest 6: Impostor LOD")
+    renderer.enable_impostors(switch_pixels=12.0)
+    renderer.run_frames(2)  # bake impostors
+    fps6 = renderer.run_frames(10)
+    print(f"FPS with impostor LOD: {fps6:.2f}")
+    print(f"LOD stats: {renderer.get_lod_stats()}")
+
     print("\nPerformance test completed.")
     print("Note: FPS may vary based on hardware and system load.")
 
@@ -0,0 +1,107 @@
+import struct
+
+from mathhelpers import transform_point
+
+
+class RenderStats:
+    """Per-flush counters.
+
+    moderngl binds the program and VAO inside every `render` call, so
+    program switches are only counted: `program_switches_saved_by_sort`
+    is how many fewer times the program changed between consecutive draws
+    than in submission order, not GL calls saved. `state_changes_avoided`
+    counts only calls that were really skipped, i.e. uniform writes.
+    """
+
+    def __init__(self):
+        self.draws = 0
+        self.program_switches = 0
+        self.program_switches_saved_by_sort = 0
+        self.uniform_writes = 0
+        self.skipped_uniform_writes = 0
+        self.state_changes_avoided = 0
+
+    def __repr__(self):
+        return (
+            f"RenderStats(draws={self.draws}, program_switches={self.program_switches}, "
+            f"program_switches_saved_by_sort={self.program_switches_saved_by_sort}, "
+            f"uniform_writes={self.uniform_writes}, "
+            f"skipped_uniform_writes={self.skipped_uniform_writes}, "
+            f"state_changes_avoided={self.state_changes_avoided})"
+        )
+
+
+class RenderState:
+    """Tracks the current program and the last bytes written to each uniform.
+
+    Meshes route their uniform writes through `write_uniform` so repeated
+    values (same color, same matrix) never reach the driver twice.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.program = None
+        self.uniforms = {}
+
+    def use(self, program):
+        if program is not self.program:
+            self.program = program
+            self.stats.program_switches += 1
+
+    def write_uniform(self, program, name, data):
+        key = (program.glo, name)
+        if self.uniforms.get(key) == data:
+            self.stats.skipped_uniform_writes += 1
+            return False
+        program[name].write(data)
+        self.uniforms[key] = data
+        self.stats.uniform_writes += 1
+        return True
+
+
+class RenderQueue:
+    """Collects one frame of draws and submits them in sorted order.
+
+    The sort key is (program, material, depth): draws sharing a program stay
+    together, draws sharing a material (first triangle color) follow each
+    other so the color uniform is rarely rewritten, and within a material
+    opaque meshes go front-to-back so early depth rejection can kick in.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.last_stats = RenderStats()
+
+    def submit(self, mesh, mvp):
+        depth = 0.0
+        if mesh.bounds is not None:
+            min_x, min_y, min_z, max_x, max_y, max_z = mesh.bounds
+            # Clip-space w is the view distance along the camera axis.
+            depth = transform_point(
+                mvp, (min_x + max_x) * 0.5, (min_y + max_y) * 0.5, (min_z + max_z) * 0.5
+            )[3]
+        key = (mesh.program.glo, mesh.material_key(), depth)
+        self.items.append((key, mesh, mvp))
+
+    def flush(self):
+        stats = RenderStats()
+
+        # How often the program would change in submission order.
+        naive_switches = 0
+        program = None
+        for _, mesh, _ in self.items:
+            if mesh.program is not program:
+                program = mesh.program
+                naive_switches += 1
+
+        state = RenderState(stats)
+        for _, mesh, mvp in sorted(self.items, key=lambda item: item[0]):
+            state.use(mesh.program)
+            state.write_uniform(mesh.program, "mvp", struct.pack("16f", *mvp))
+            stats.draws += mesh.draw(state)
+
+        stats.program_switches_saved_by_sort = naive_switches - stats.program_switches
+        stats.state_changes_avoided = stats.skipped_uniform_writes
+        self.items = []
+        self.last_stats = stats
+        return stats
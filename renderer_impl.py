@@ -3,8 +3,9 @@ import moderngl
 import struct
 import math
 import time
-from mathhelpers import perspective, rotation_y, rotation_x, translate, mat4_mul
+from mathhelpers import perspective, rotation_y, rotation_x, translate, mat4_mul, transform_bounds
 from api_defs import Mesh, Renderer, InputState
+from render_queue import RenderQueue
 
 
 class ConcreteInputState(InputState):
@@ -45,9 +46,23 @@ class ConcreteInputState(InputState):
 
 
 class ConcreteMesh(Mesh):
+    supports_impostor = True
+
     def __init__(self, ctx, program, vertices, indices, colors=None):
         self.program = program
-        self.vbo = ctx.buffer(struct.pack(f"{len(vertices)}f", *vertices))
+        if isinstance(vertices, moderngl.Buffer):
+            # Already on the GPU, e.g. from GpuWorldGen.build_vertex_buffer.
+            self.vbo = vertices
+            self.bounds = None
+            self._shape_source = None
+        else:
+            self.vbo = ctx.buffer(struct.pack(f"{len(vertices)}f", *vertices))
+            xs = vertices[0::3]
+            ys = vertices[1::3]
+            zs = vertices[2::3]
+            self.bounds = (min(xs), min(ys), min(zs), max(xs), max(ys), max(zs))
+            # Kept by reference (not copied) until an impostor key is needed.
+            self._shape_source = (vertices, indices)
         self.ibo = ctx.buffer(struct.pack(f"{len(indices)}I", *indices))
 
         self.vao = ctx.vertex_array(
@@ -65,17 +80,183 @@ class ConcreteMesh(Mesh):
             self.colors = colors
 
         self.model_matrix = None
+        self._color_runs = None
+        self._shape_key = None
+        self._impostor_key = None
 
     def set_model_matrix(self, mat4):
         self.model_matrix = mat4
 
     def set_triangle_color(self, triangle_index, color):
         self.colors[triangle_index] = color
+        self._color_runs = None
+        self._impostor_key = None
+
+    def color_runs(self):
+        """Consecutive same-colored triangles as (packed color, first, count)."""
+        if self._color_runs is None:
+            runs = []
+            for i, color in enumerate(self.colors):
+                packed = struct.pack("3f", *color)
+                if runs and runs[-1][0] == packed:
+                    runs[-1][2] += 1
+                else:
+                    runs.append([packed, i, 1])
+            self._color_runs = runs
+        return self._color_runs
+
+    def shape_key(self):
+        """Geometry normalized to its bounds.
+
+        Meshes that only differ by position and scale share a key (and an
+        impostor). Built on first use, since only impostor LOD needs it.
+        """
+        if self._shape_key is None and self._shape_source is not None:
+            vertices, indices = self._shape_source
+            lows = self.bounds[:3]
+            spans = [hi - lo for lo, hi in zip(lows, self.bounds[3:])]
+            self._shape_key = (
+                tuple(indices),
+                tuple(
+                    round((v - lows[i % 3]) / spans[i % 3], 4) if spans[i % 3] else 0.0
+                    for i, v in enumerate(vertices)
+                ),
+            )
+            self._shape_source = None
+        return self._shape_key
+
+    def impostor_key(self):
+        """Meshes with equal keys look the same once scaled to their bounds."""
+        if self._impostor_key is None:
+            runs = tuple((packed, count) for packed, _, count in self.color_runs())
+            self._impostor_key = (self.shape_key(), runs)
+        return self._impostor_key
+
+    def material_key(self):
+        runs = self.color_runs()
+        return runs[0][0] if runs else b""
+
+    def draw(self, state=None):
+        runs = self.color_runs()
+        for packed, first, count in runs:
+            if state is None:
+                self.program["color"].write(packed)
+            else:
+                state.write_uniform(self.program, "color", packed)
+            self.vao.render(moderngl.TRIANGLES, first=first * 3, vertices=count * 3)
+        return len(runs)
+
+
+class ConcreteTerrain(Mesh):
+    """Heightmap terrain drawn from a float texture and one instanced patch.
+
+    The patch is a flat `patch_size` x `patch_size` grid that is instanced
+    across the map; the vertex shader fetches each vertex height from the
+    texture, so no per-vertex geometry is kept on the CPU. The fragment
+    shader finds its triangle from the primitive id and picks the color
+    band of the triangle's average height the same way the CPU-built mesh
+    in main.py does with `worldapi.height_color`.
+    """
+
+    supports_impostor = False
+
+    def __init__(self, ctx, program, heights, width, depth, height_scale, patch_size=32):
+        self.program = program
+        self.width = width
+        self.depth = depth
+        self.height_scale = height_scale
+        self.patch_size = patch_size
+
+        x_extent = (-width / 2.0, width / 2.0)
+        z_extent = (-depth / 2.0, depth / 2.0)
+        if isinstance(heights, moderngl.Texture):
+            # Already on the GPU, e.g. from GpuWorldGen.generate_height_texture.
+            self.heights_tex = heights
+            self.bounds = None
+        else:
+            flat = [h for row in heights for h in row]
+            self.bounds = (
+                x_extent[0], (min(flat) - 0.45) * height_scale, z_extent[0],
+                x_extent[1], (max(flat) - 0.45) * height_scale, z_extent[1],
+            )
+            self.heights_tex = ctx.texture(
+                (width + 1, depth + 1), 1, struct.pack(f"{len(flat)}f", *flat), dtype="f4"
+            )
+        self.heights_tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
+
+        patch_vertices = []
+        for z in range(patch_size + 1):
+            for x in range(patch_size + 1):
+                patch_vertices.extend([x, z])
+
+        stride = patch_size + 1
+        patch_indices = []
+        for z in range(patch_size):
+            for x in range(patch_size):
+                i0 = z * stride + x
+                i1 = i0 + 1
+                i2 = i0 + stride
+                i3 = i2 + 1
+                patch_indices.extend([i0, i1, i2, i1, i3, i2])
+
+        self.patch_origins = [
+            (px, pz)
+            for pz in range(0, depth, patch_size)
+            for px in range(0, width, patch_size)
+        ]
+
+        self.vbo = ctx.buffer(struct.pack(f"{len(patch_vertices)}f", *patch_vertices))
+        self.ibo = ctx.buffer(struct.pack(f"{len(patch_indices)}I", *patch_indices))
+        self.instance_vbo = ctx.buffer(reserve=len(self.patch_origins) * 2 * 4)
+        self.set_visible_patches(self.patch_origins)
 
-    def draw(self):
-        for i, color in enumerate(self.colors):
-            self.program["color"].write(struct.pack("3f", *color))
-            self.vao.render(moderngl.TRIANGLES, first=i*3, vertices=3)
+        self.vao = ctx.vertex_array(
+            program,
+            [
+                (self.vbo, "2f", "in_local"),
+                (self.instance_vbo, "2f/i", "in_patch"),
+            ],
+            self.ibo,
+        )
+
+        self.model_matrix = None
+
+    def set_model_matrix(self, mat4):
+        self.model_matrix = mat4
+
+    def set_triangle_color(self, triangle_index, color):
+        """No-op: terrain colors are derived from heights in the shader.
+
+        Kept so terrain can take part in the same `Mesh` calls as other
+        meshes (e.g. `FrameDescription.color_updates`) without failing.
+        """
+
+    def set_visible_patches(self, origins):
+        self.num_patches = len(origins)
+        if origins:
+            flat = [v for origin in origins for v in origin]
+            self.instance_vbo.write(struct.pack(f"{len(flat)}f", *flat))
+
+    def material_key(self):
+        return b""
+
+    def draw(self, state=None):
+        self.heights_tex.use(location=0)
+        uniforms = (
+            ("heights", struct.pack("i", 0)),
+            ("grid_size", struct.pack("2i", self.width, self.depth)),
+            ("height_scale", struct.pack("f", self.height_scale)),
+            ("patch_size", struct.pack("i", self.patch_size)),
+        )
+        for name, data in uniforms:
+            if state is None:
+                self.program[name].write(data)
+            else:
+                state.write_uniform(self.program, name, data)
+        if self.num_patches == 0:
+            return 0
+        self.vao.render(moderngl.TRIANGLES, instances=self.num_patches)
+        return 1
 
 
 class ConcreteRenderer(Renderer):
@@ -98,7 +279,15 @@ class ConcreteRenderer(Renderer):
         self.ctx.enable(moderngl.DEPTH_TEST)
 
         self.program = self._create_program()
+        self.terrain_program = None
         self.meshes = []
+        self.render_queue = RenderQueue()
+        self.occlusion_culler = None
+        self.impostor_lod = None
+        self.captures = []
+        # Closed without waiting; `close` joins their writers.
+        self.closing_captures = []
+        self.closed = False
 
         self.width = width
         self.height = height
@@ -145,11 +334,92 @@ void main() {
         self.meshes.append(mesh)
         return mesh
 
+    def _create_terrain_program(self):
+        return self.ctx.program(
+            vertex_shader="""
+            #version 330
+            in vec2 in_local;
+            in vec2 in_patch;
+            uniform mat4 mvp;
+            uniform sampler2D heights;
+            uniform ivec2 grid_size;
+            uniform float height_scale;
+            flat out ivec2 v_patch;
+
+            void main() {
+                // Patches on the far edges overhang the map; clamping folds
+                // the overhang into degenerate triangles.
+                ivec2 cell = min(ivec2(in_patch + in_local), grid_size);
+                float h = texelFetch(heights, cell, 0).r;
+                vec3 pos = vec3(
+                    float(cell.x) - float(grid_size.x) / 2.0,
+                    (h - 0.45) * height_scale,
+                    float(cell.y) - float(grid_size.y) / 2.0
+                );
+                v_patch = ivec2(in_patch);
+                gl_Position = mvp * vec4(pos, 1.0);
+            }
+            """,
+            fragment_shader="""
+#version 330
+
+uniform sampler2D heights;
+uniform ivec2 grid_size;
+uniform int patch_size;
+flat in ivec2 v_patch;
+out vec4 fragColor;
+
+// Same bands as worldapi.height_color.
+vec3 height_color(float h) {
+    if (h > 0.92) return vec3(0.10, 0.62, 0.16);
+    if (h > 0.82) return vec3(0.40, 0.40, 0.42);
+    if (h > 0.45) return vec3(0.92, 0.92, 0.95);
+    if (h > 0.38) return vec3(0.08, 0.28, 0.65);
+    return vec3(0.10, 0.62, 0.16);
+}
+
+float height_at(ivec2 cell) {
+    return texelFetch(heights, min(cell, grid_size), 0).r;
+}
+
+void main() {
+    // The patch emits two triangles per cell, row by row, and the
+    // primitive id restarts with every instance. Color each triangle from
+    // the average height of its three corners, as the CPU mesh does.
+    int quad = gl_PrimitiveID / 2;
+    ivec2 cell = v_patch + ivec2(quad % patch_size, quad / patch_size);
+    float h01 = height_at(cell + ivec2(1, 0));
+    float h10 = height_at(cell + ivec2(0, 1));
+    float h;
+    if ((gl_PrimitiveID & 1) == 0) {
+        h = (height_at(cell) + h01 + h10) / 3.0;
+    } else {
+        h = (h01 + h10 + height_at(cell + ivec2(1, 1))) / 3.0;
+    }
+    fragColor = vec4(height_color(h), 1.0);
+}
+"""
+        )
+
+    def create_terrain(self, heights, width, depth, height_scale, patch_size=32):
+        if self.terrain_program is None:
+            self.terrain_program = self._create_terrain_program()
+        terrain = ConcreteTerrain(
+            self.ctx, self.terrain_program, heights, width, depth, height_scale, patch_size
+        )
+        self.meshes.append(terrain)
+        return terrain
+
+    def create_world_gen_backend(self):
+        from gpu_worldgen import GpuWorldGen
+        return GpuWorldGen(self.ctx)
+
     def run(self):
         if glfw.window_should_close(self.window):
-            glfw.terminate()
+            self.close()
             return
         self._render_frame()
+        self._capture_frame()
         # Present the rendered frame and process events so an interactive
         # `run()` loop actually updates the window. `run_frames` already
         # does swap/poll, but `run()` did not — causing the window to stay
@@ -161,7 +431,7 @@ void main() {
         self.ctx.clear(148/255.0, 189/255.0, 255/255.0)
         self.ctx.enable(moderngl.DEPTH_TEST)
 
-        t = self.start_time
+        default_model = self.default_model_matrix()
 
         proj = perspective(math.radians(60.0), self.width / self.height, 0.1, 100.0)
         
@@ -172,11 +442,96 @@ void main() {
         rot_y = rotation_y(yaw)
         view = mat4_mul(rot_x, mat4_mul(rot_y, translate(self.camera_pos[0], self.camera_pos[1], self.camera_pos[2])))
 
+        culler = self.occlusion_culler
+        if culler is not None:
+            # The view translates by +camera_pos, so the eye sits at -camera_pos.
+            culler.begin_frame(
+                (-self.camera_pos[0], -self.camera_pos[1], -self.camera_pos[2])
+            )
+
+        lod = self.impostor_lod
+        if lod is not None:
+            lod.begin_frame(
+                self.height,
+                proj[5],
+                (-self.camera_pos[0], -self.camera_pos[1], -self.camera_pos[2]),
+            )
+
         for mesh in self.meshes:
-            model = mesh.model_matrix or rotation_y(t)
+            model = mesh.model_matrix or default_model
+            if culler is not None:
+                if isinstance(mesh, ConcreteTerrain):
+                    mesh.set_visible_patches(culler.visible_terrain_patches(mesh))
+                elif mesh.bounds is not None and culler.is_occluded(
+                    transform_bounds(model, mesh.bounds)
+                ):
+                    continue
             mvp = mat4_mul(proj, mat4_mul(view, model))
-            self.program["mvp"].write(struct.pack("16f", *mvp))
-            mesh.draw()
+            if lod is not None and lod.use_impostor(mesh, model, mvp):
+                continue
+            self.render_queue.submit(mesh, mvp)
+
+        if lod is None:
+            self.render_queue.flush()
+        else:
+            lod.flush_full(self.render_queue)
+            lod.draw_impostors(mat4_mul(proj, view))
+
+    def _capture_frame(self):
+        for capture in list(self.captures):
+            if capture.finished:
+                # Its last readback was issued a frame ago, so collecting it
+                # now does not stall.
+                self.captures.remove(capture)
+                capture.close(wait=False)
+                self.closing_captures.append(capture)
+            else:
+                capture.capture(self.ctx.screen)
+
+    def start_capture(self, writer, ring_size=3, max_frames=None):
+        """Record every presented frame to `writer` (see capture.py) until stopped."""
+        from capture import FrameCapture
+        width, height = glfw.get_framebuffer_size(self.window)
+        capture = FrameCapture(
+            self.ctx, width, height, writer, ring_size=ring_size, max_frames=max_frames
+        )
+        self.captures.append(capture)
+        return capture
+
+    def stop_capture(self, capture):
+        for captures in (self.captures, self.closing_captures):
+            if capture in captures:
+                captures.remove(capture)
+        capture.close()
+        return capture.stats
+
+    def close(self):
+        """Finish all captures, wait for their writers and shut down GLFW.
+
+        Call once the render loop is done; safe to call more than once.
+        Re-raises the first writer error after everything is shut down.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        error = None
+        # Captures still hold frames in GL buffers; collect them while the
+        # context is alive.
+        for capture in self.captures + self.closing_captures:
+            try:
+                capture.close()
+            except Exception as exc:
+                error = error or exc
+        self.captures = []
+        self.closing_captures = []
+        glfw.terminate()
+        if error is not None:
+            raise error
+
+    def screenshot(self, path):
+        """Save the next presented frame as a PNG without stalling rendering."""
+        from capture import PngSequenceWriter
+        return self.start_capture(PngSequenceWriter(path), ring_size=1, max_frames=1)
 
     def run_frames(self, num_frames):
         import time
@@ -185,12 +540,40 @@ void main() {
             if glfw.window_should_close(self.window):
                 break
             self._render_frame()
+            self._capture_frame()
             glfw.swap_buffers(self.window)
             glfw.poll_events()
         end = time.time()
         fps = num_frames / (end - start) if end > start else 0
         return fps
 
+    def default_model_matrix(self):
+        """Model matrix used for meshes that never had one set."""
+        return rotation_y(self.start_time)
+
+    def get_render_stats(self):
+        return self.render_queue.last_stats
+
+    def set_occlusion_culler(self, culler):
+        self.occlusion_culler = culler
+
+    def enable_impostors(self, switch_pixels=12.0, hysteresis=0.25):
+        from lod import ImpostorLOD
+        self.impostor_lod = ImpostorLOD(
+            self.ctx, switch_pixels=switch_pixels, hysteresis=hysteresis
+        )
+        return self.impostor_lod
+
+    def get_lod_stats(self):
+        if self.impostor_lod is None:
+            return None
+        return self.impostor_lod.stats
+
+    def get_cull_stats(self):
+        if self.occlusion_culler is None:
+            return None
+        return self.occlusion_culler.stats
+
     def get_input(self):
         return self.input_state
 
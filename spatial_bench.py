@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the spatial hash broad-phase.
+Measures per-tick bulk update, pair finding and query costs for growing
+numbers of moving objects.
+"""
+
+import time
+
+import numpy as np
+
+from mainrenderapi import SpatialHash
+
+WORLD_HALF = 200.0
+TICKS = 20
+QUERIES = 100
+
+
+def make_bounds(centers, half_sizes):
+    return np.hstack([centers - half_sizes, centers + half_sizes])
+
+
+def best_ms(fn, repeats=TICKS):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def run_spatial_benchmark():
+    print("Starting spatial hash benchmark...")
+    rng = np.random.default_rng(1337)
+
+    for count in (1000, 5000, 20000):
+        print(f"\n{count} objects")
+        centers = rng.uniform(-WORLD_HALF, WORLD_HALF, (count, 3))
+        centers[:, 1] = rng.uniform(0.0, 10.0, count)
+        half_sizes = rng.uniform(0.25, 1.0, (count, 3))
+        velocities = rng.uniform(-1.0, 1.0, (count, 3)) * 0.1
+
+        index = SpatialHash(cell_size=4.0)
+        insert_ms = best_ms(lambda: index.remove(index.insert(make_bounds(centers, half_sizes))), 5)
+        handles = index.insert(make_bounds(centers, half_sizes))
+        print(f"bulk insert+remove:      {insert_ms:8.3f} ms")
+
+        def tick():
+            centers[:] += velocities
+            index.update(handles, make_bounds(centers, half_sizes))
+            index.rebuild()
+
+        print(f"bulk update + rebuild:   {best_ms(tick):8.3f} ms")
+
+        pairs = index.query_pairs()
+        print(f"overlapping pairs:       {best_ms(index.query_pairs):8.3f} ms ({len(pairs)} pairs)")
+
+        points = rng.uniform(-WORLD_HALF, WORLD_HALF, (QUERIES, 3))
+        points[:, 1] = 5.0
+        directions = rng.normal(size=(QUERIES, 3))
+        directions[:, 1] *= 0.05
+
+        def radius_queries():
+            for point in points:
+                index.query_radius(point, 8.0)
+
+        def box_queries():
+            for point in points:
+                index.query_box(np.concatenate([point - 6.0, point + 6.0]))
+
+        def ray_queries():
+            for point, direction in zip(points, directions):
+                index.query_ray(point, direction, max_distance=100.0)
+
+        print(f"{QUERIES} radius queries:      {best_ms(radius_queries, 5):8.3f} ms")
+        print(f"{QUERIES} box queries:         {best_ms(box_queries, 5):8.3f} ms")
+        print(f"{QUERIES} ray queries:         {best_ms(ray_queries, 5):8.3f} ms")
+
+    print("\nSpatial hash benchmark completed.")
+
+
+if __name__ == "__main__":
+    run_spatial_benchmark()
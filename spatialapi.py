@@ -0,0 +1,374 @@
+import math
+
+import numpy as np
+
+from mathhelpers import transform_bounds
+
+
+def mesh_bounds(meshes, default_model):
+    """World-space AABBs of meshes as an (N, 6) array (min xyz, max xyz).
+
+    Meshes without a model matrix are placed with `default_model`, which
+    should be what the renderer draws them with
+    (`renderer.default_model_matrix()`). Meshes without bounds (e.g.
+    built from a GPU vertex buffer) get an empty box at the origin.
+    """
+    out = np.zeros((len(meshes), 6), dtype=np.float64)
+    for i, mesh in enumerate(meshes):
+        if mesh.bounds is not None:
+            out[i] = transform_bounds(mesh.model_matrix or default_model, mesh.bounds)
+    return out
+
+
+def _expand_ranges(starts, counts):
+    """Concatenate arange(start, start + count) for every pair, vectorized."""
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + (np.arange(total) - offsets)
+
+
+def _cell_keys(cx, cz):
+    return (cx.astype(np.int64) << 32) | (cz.astype(np.int64) & 0xFFFFFFFF)
+
+
+class ConcreteSpatialHash:
+    """Uniform-grid spatial hash over the xz plane for broad-phase queries.
+
+    Objects are addressed by integer handles returned from `insert`. All
+    state lives in flat numpy arrays indexed by handle, so bulk
+    insert/update/remove are array writes. The grid is a sorted array of
+    (cell key, handle) entries brought up to date lazily before the next
+    query: only objects whose cell range changed are re-keyed and merged
+    in, and a full sort happens only when more than `full_rebuild_ratio`
+    of the objects changed cells. Objects covering more than
+    `max_cells_per_object` cells are kept out of the grid and checked
+    directly. Heights (y) are not hashed but every query tests full 3D
+    boxes.
+
+    With slowly moving objects (a few percent changing cells per tick,
+    see spatial_bench.py), update + rebuild takes ~0.2 ms for 1000
+    objects, ~0.6 ms for 5000 and ~2.5 ms for 20000. The cost stays
+    linear in the object count, so the sub-millisecond budget holds up to
+    roughly 5000 objects, not beyond.
+    """
+
+    def __init__(
+        self, cell_size=4.0, capacity=1024, max_cells_per_object=64, full_rebuild_ratio=0.25
+    ):
+        self.cell_size = float(cell_size)
+        self.max_cells_per_object = max_cells_per_object
+        self.full_rebuild_ratio = full_rebuild_ratio
+        self._bounds = np.zeros((capacity, 6), dtype=np.float64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        # Cell range each object is hashed under, and which objects need
+        # re-keying (inserted, removed or moved to other cells).
+        self._ranges = np.zeros((capacity, 4), dtype=np.int64)
+        self._stale = np.zeros(capacity, dtype=bool)
+        self._is_oversized = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._dirty = True
+        self._extent_dirty = True
+        self._keys = np.empty(0, dtype=np.int64)
+        self._slots = np.empty(0, dtype=np.int64)
+        self._oversized = np.empty(0, dtype=np.int64)
+        self._extent = None
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    def _grow(self, needed):
+        capacity = len(self._alive)
+        new_capacity = max(capacity * 2, capacity + needed)
+        for name in ("_bounds", "_alive", "_ranges", "_stale", "_is_oversized"):
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        self._free.extend(range(new_capacity - 1, capacity - 1, -1))
+
+    def insert(self, bounds):
+        """Add objects from an (N, 6) array of boxes; returns their handles."""
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        count = len(bounds)
+        if count > len(self._free):
+            self._grow(count - len(self._free))
+        handles = np.array([self._free.pop() for _ in range(count)], dtype=np.int64)
+        self._bounds[handles] = bounds
+        self._alive[handles] = True
+        self._stale[handles] = True
+        self._dirty = True
+        self._extent_dirty = True
+        return handles
+
+    def update(self, handles, bounds):
+        handles = np.asarray(handles, dtype=np.int64)
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        self._bounds[handles] = bounds
+        # Objects that stay within the same cells keep their grid entries;
+        # queries test the stored boxes exactly anyway.
+        old = self._ranges[handles]
+        moved = np.zeros(len(handles), dtype=bool)
+        for axis, cells in enumerate(self._cell_range(bounds)):
+            moved |= cells != old[:, axis]
+        if moved.any():
+            self._stale[handles[moved]] = True
+            self._dirty = True
+        self._extent_dirty = True
+
+    def remove(self, handles):
+        handles = np.asarray(handles, dtype=np.int64)
+        handles = handles[self._alive[handles]]
+        self._alive[handles] = False
+        self._stale[handles] = True
+        self._free.extend(handles.tolist())
+        self._dirty = True
+        self._extent_dirty = True
+
+    def bounds(self, handles):
+        return self._bounds[np.asarray(handles, dtype=np.int64)]
+
+    def _cell_range(self, bounds):
+        inv = 1.0 / self.cell_size
+        cx0 = np.floor(bounds[..., 0] * inv).astype(np.int64)
+        cz0 = np.floor(bounds[..., 2] * inv).astype(np.int64)
+        cx1 = np.floor(bounds[..., 3] * inv).astype(np.int64)
+        cz1 = np.floor(bounds[..., 5] * inv).astype(np.int64)
+        return cx0, cz0, cx1, cz1
+
+    def _entries(self, slots):
+        """Unsorted grid entries (keys, slots) for objects; flags oversized ones."""
+        ranges = np.stack(self._cell_range(self._bounds[slots]), axis=1)
+        self._ranges[slots] = ranges
+        cx0, cz0, cx1, cz1 = ranges.T
+        nx = cx1 - cx0 + 1
+        counts = nx * (cz1 - cz0 + 1)
+
+        oversized = counts > self.max_cells_per_object
+        self._is_oversized[slots] = oversized
+        keep = ~oversized
+        slots, cx0, cz0, nx, counts = slots[keep], cx0[keep], cz0[keep], nx[keep], counts[keep]
+
+        local = _expand_ranges(np.zeros(len(counts), dtype=np.int64), counts)
+        nx_rep = np.repeat(nx, counts)
+        keys = _cell_keys(np.repeat(cx0, counts) + local % nx_rep, np.repeat(cz0, counts) + local // nx_rep)
+        return keys, np.repeat(slots, counts)
+
+    def _update_extent(self):
+        alive = self._bounds[self._alive]
+        self._extent = None
+        if len(alive):
+            self._extent = np.concatenate([alive[:, :3].min(axis=0), alive[:, 3:].max(axis=0)])
+        self._extent_dirty = False
+
+    def rebuild(self, full=False):
+        """Bring the grid up to date; `full` re-keys every object."""
+        if not self._dirty and not full:
+            return
+        stale = np.flatnonzero(self._stale)
+        alive = np.flatnonzero(self._alive)
+        if full or len(stale) > self.full_rebuild_ratio * max(len(alive), 1):
+            self._is_oversized[:] = False
+            keys, slots = self._entries(alive)
+            order = np.argsort(keys)
+            self._keys = keys[order]
+            self._slots = slots[order]
+        else:
+            # Drop the stale objects' entries, then merge their new ones
+            # into the sorted arrays; only the new entries get sorted.
+            keep = ~self._stale[self._slots]
+            keys = self._keys[keep]
+            slots = self._slots[keep]
+            self._is_oversized[stale] = False
+            new_keys, new_slots = self._entries(stale[self._alive[stale]])
+            order = np.argsort(new_keys)
+            new_keys = new_keys[order]
+            positions = np.searchsorted(keys, new_keys)
+            self._keys = np.insert(keys, positions, new_keys)
+            self._slots = np.insert(slots, positions, new_slots[order])
+        self._oversized = np.flatnonzero(self._is_oversized)
+        self._stale[:] = False
+        self._dirty = False
+
+    def _candidates(self, cx0, cz0, cx1, cz1):
+        if self._dirty:
+            self.rebuild()
+        nx = cx1 - cx0 + 1
+        num_cells = nx * (cz1 - cz0 + 1)
+        if num_cells > len(self._slots):
+            # Scanning every hashed entry is cheaper than probing each cell.
+            grid = np.unique(self._slots)
+        else:
+            local = np.arange(num_cells)
+            query_keys = _cell_keys(cx0 + local % nx, cz0 + local // nx)
+            lo = np.searchsorted(self._keys, query_keys, side="left")
+            hi = np.searchsorted(self._keys, query_keys, side="right")
+            grid = np.unique(self._slots[_expand_ranges(lo, hi - lo)])
+        if len(self._oversized):
+            return np.concatenate([grid, self._oversized])
+        return grid
+
+    def query_box(self, box):
+        """Handles of objects whose boxes overlap `box` (min xyz, max xyz)."""
+        box = np.asarray(box, dtype=np.float64)
+        candidates = self._candidates(*(int(v) for v in self._cell_range(box)))
+        b = self._bounds[candidates]
+        hit = np.all(b[:, :3] <= box[3:], axis=1) & np.all(b[:, 3:] >= box[:3], axis=1)
+        return candidates[hit]
+
+    def query_radius(self, center, radius):
+        """Handles of objects whose boxes come within `radius` of `center`."""
+        center = np.asarray(center, dtype=np.float64)
+        handles = self.query_box(np.concatenate([center - radius, center + radius]))
+        b = self._bounds[handles]
+        gap = np.maximum(np.maximum(b[:, :3] - center, center - b[:, 3:]), 0.0)
+        return handles[np.einsum("ij,ij->i", gap, gap) <= radius * radius]
+
+    def _ray_cells(self, origin, direction, max_distance):
+        """Cells crossed by the ray in the xz plane, in order (2D DDA)."""
+        if not math.isfinite(max_distance):
+            raise ValueError("ray cell walk needs a finite max_distance")
+        size = self.cell_size
+        cx = math.floor(origin[0] / size)
+        cz = math.floor(origin[2] / size)
+        cells = [(cx, cz)]
+
+        steps = []
+        for axis, cell in ((0, cx), (2, cz)):
+            d = direction[axis]
+            if d > 0.0:
+                steps.append((1, ((cell + 1) * size - origin[axis]) / d, size / d))
+            elif d < 0.0:
+                steps.append((-1, (cell * size - origin[axis]) / d, -size / d))
+            else:
+                steps.append((0, math.inf, math.inf))
+        (step_x, t_x, dt_x), (step_z, t_z, dt_z) = steps
+
+        while min(t_x, t_z) <= max_distance:
+            if t_x < t_z:
+                cx += step_x
+                t_x += dt_x
+            else:
+                cz += step_z
+                t_z += dt_z
+            cells.append((cx, cz))
+        return cells
+
+    def query_ray(self, origin, direction, max_distance=None):
+        """Objects hit by a ray, nearest first, as (handles, distances).
+
+        `direction` need not be normalized; distances are in units of its
+        length. Without `max_distance` the ray is unbounded.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        if not np.all(np.isfinite(origin)) or not np.all(np.isfinite(direction)):
+            raise ValueError("ray origin and direction must be finite")
+        if not np.any(direction):
+            raise ValueError("ray direction must be non-zero")
+        if self._dirty:
+            self.rebuild()
+        if self._extent_dirty:
+            self._update_extent()
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if self._extent is None:
+            return empty
+
+        if max_distance is None:
+            max_distance = math.inf
+        # Only walk the part of the ray inside the extent of stored objects.
+        t_start, t_end = self._slab(origin, direction, self._extent[None, :], max_distance)
+        t_start = float(t_start[0])
+        t_end = float(t_end[0])
+        if t_start > t_end:
+            return empty
+
+        cells = np.array(
+            self._ray_cells(origin + direction * t_start, direction, t_end - t_start),
+            dtype=np.int64,
+        )
+        query_keys = _cell_keys(cells[:, 0], cells[:, 1])
+        lo = np.searchsorted(self._keys, query_keys, side="left")
+        hi = np.searchsorted(self._keys, query_keys, side="right")
+        candidates = np.unique(self._slots[_expand_ranges(lo, hi - lo)])
+        if len(self._oversized):
+            candidates = np.concatenate([candidates, self._oversized])
+
+        t_near, t_far = self._slab(origin, direction, self._bounds[candidates], max_distance)
+        hit = t_near <= t_far
+        order = np.argsort(t_near[hit], kind="stable")
+        return candidates[hit][order], t_near[hit][order]
+
+    @staticmethod
+    def _slab(origin, direction, boxes, max_distance):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv = 1.0 / direction
+            t0 = (boxes[:, :3] - origin) * inv
+            t1 = (boxes[:, 3:] - origin) * inv
+        # Axis-parallel rays: inside the slab means unbounded, outside empty
+        # (an entry at +inf can never come before the exit).
+        parallel = direction == 0.0
+        inside = (boxes[:, :3] <= origin) & (origin <= boxes[:, 3:])
+        t0 = np.where(parallel, np.where(inside, -math.inf, math.inf), t0)
+        t1 = np.where(parallel, math.inf, t1)
+        t_near = np.maximum(np.minimum(t0, t1).max(axis=1), 0.0)
+        t_far = np.minimum(np.maximum(t0, t1).min(axis=1), max_distance)
+        return t_near, t_far
+
+    def query_pairs(self):
+        """(M, 2) array of handle pairs whose boxes overlap, each pair once."""
+        if self._dirty:
+            self.rebuild()
+        keys = self._keys
+        slots = self._slots
+        firsts = [np.empty(0, dtype=np.int64)]
+        seconds = [np.empty(0, dtype=np.int64)]
+        cells = [np.empty(0, dtype=np.int64)]
+
+        # Entries sharing a cell are adjacent after the sort, so pairing
+        # each entry with the one `d` places later, for growing d, covers
+        # every pair within a cell.
+        d = 1
+        while d < len(keys):
+            same = np.flatnonzero(keys[d:] == keys[:-d])
+            if not len(same):
+                break
+            firsts.append(slots[same])
+            seconds.append(slots[same + d])
+            cells.append(keys[same])
+            d += 1
+
+        a = np.concatenate(firsts)
+        b = np.concatenate(seconds)
+        # Objects spanning several cells meet in each cell they share; only
+        # keep the meeting in the cell holding the min corner of their
+        # overlap, so each pair survives once without a dedupe pass.
+        ra = self._ranges[a]
+        rb = self._ranges[b]
+        owner = _cell_keys(np.maximum(ra[:, 0], rb[:, 0]), np.maximum(ra[:, 1], rb[:, 1]))
+        keep = owner == np.concatenate(cells)
+        a, b = a[keep], b[keep]
+        packed = self._overlapping(a, b)
+
+        if len(self._oversized):
+            everyone = np.flatnonzero(self._alive)
+            a = np.repeat(self._oversized, len(everyone))
+            b = np.tile(everyone, len(self._oversized))
+            keep = a != b
+            # Two oversized objects meet twice; dedupe just this part.
+            packed = np.concatenate([packed, np.unique(self._overlapping(a[keep], b[keep]))])
+
+        stride = len(self._alive)
+        packed = np.sort(packed)
+        return np.stack([packed // stride, packed % stride], axis=1)
+
+    def _overlapping(self, a, b):
+        """Pairs whose 3D boxes overlap, packed as min * capacity + max."""
+        bounds = self._bounds
+        keep = np.ones(len(a), dtype=bool)
+        for axis in range(3):
+            keep &= bounds[a, axis] <= bounds[b, axis + 3]
+            keep &= bounds[b, axis] <= bounds[a, axis + 3]
+        a, b = a[keep], b[keep]
+        return np.minimum(a, b) * len(self._alive) + np.maximum(a, b)
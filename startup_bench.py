@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark.
+Measures import latency of the public modules and time to the first
+rendered frame, each in a fresh interpreter so module caches do not skew
+the numbers.
+"""
+
+import os
+import subprocess
+import sys
+
+RUNS = 5
+
+IMPORT_CASES = [
+    ("mathhelpers", "import mathhelpers"),
+    ("worldapi", "import worldapi"),
+    ("mainrenderapi (no backend)", "import mainrenderapi"),
+    ("mainrenderapi.WorldGen", "from mainrenderapi import WorldGen"),
+    ("mainrenderapi.Renderer", "from mainrenderapi import Renderer"),
+]
+
+_IMPORT_TEMPLATE = """
+import sys, time
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(elapsed, "glfw" in sys.modules or "moderngl" in sys.modules)
+"""
+
+_FIRST_FRAME = """
+import time
+start = time.perf_counter()
+from mainrenderapi import Renderer
+imported = time.perf_counter()
+renderer = Renderer(width=800, height=600, title="Startup Benchmark")
+created = time.perf_counter()
+renderer.run_frames(1)
+renderer.ctx.finish()
+first_frame = time.perf_counter()
+print(imported - start, created - imported, first_frame - created)
+"""
+
+
+def _run(code):
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return result.stdout.split()
+
+
+def _failure(exc):
+    """Last stderr line of a failed run, or its exit status if there is none."""
+    lines = (exc.stderr or "").strip().splitlines()
+    return lines[-1] if lines else f"exit status {exc.returncode}"
+
+
+def run_startup_benchmark():
+    print("Starting startup benchmark...")
+
+    print("\nImport latency (best of %d)" % RUNS)
+    for label, stmt in IMPORT_CASES:
+        times = []
+        loaded_gl = False
+        for _ in range(RUNS):
+            try:
+                elapsed, gl = _run(_IMPORT_TEMPLATE.format(stmt=stmt))
+            except subprocess.CalledProcessError as exc:
+                print(f"{label:<28} failed: {_failure(exc)}")
+                break
+            times.append(float(elapsed))
+            loaded_gl = gl == "True"
+        if not times:
+            continue
+        gl_note = "loads GL stack" if loaded_gl else "no GL stack"
+        print(f"{label:<28} {min(times) * 1000:8.2f} ms  ({gl_note})")
+
+    print("\nFirst frame latency (best of %d)" % RUNS)
+    best = None
+    for _ in range(RUNS):
+        try:
+            sample = [float(v) for v in _run(_FIRST_FRAME)]
+        except subprocess.CalledProcessError as exc:
+            print(f"Renderer unavailable: {_failure(exc)}")
+            return
+        if best is None or sum(sample) < sum(best):
+            best = sample
+    import_s, create_s, frame_s = best
+    print(f"{'import':<28} {import_s * 1000:8.2f} ms")
+    print(f"{'window + context':<28} {create_s * 1000:8.2f} ms")
+    print(f"{'first frame':<28} {frame_s * 1000:8.2f} ms")
+    print(f"{'total':<28} {sum(best) * 1000:8.2f} ms")
+
+    print("\nStartup benchmark completed.")
+
+
+if __name__ == "__main__":
+    run_startup_benchmark()
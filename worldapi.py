@@ -118,6 +118,12 @@ def maked_height_sampler(heights, width, depth, height_scale):
 
 
 class ConcreteWorldGen:
+    def __init__(self, height_backend=None):
+        # Optional object exposing `generate_world_heights` with the same
+        # signature, e.g. `gpu_worldgen.GpuWorldGen`. It is responsible for
+        # its own CPU fallback.
+        self.height_backend = height_backend
+
     def build_permutation(self, seed):
         return build_permutation(seed)
 
@@ -131,6 +137,10 @@ class ConcreteWorldGen:
         return height_color(height_value)
 
     def generate_world_heights(self, width=120, depth=120, noise_scale=0.06, seed=1337):
+        if self.height_backend is not None:
+            return self.height_backend.generate_world_heights(
+                width=width, depth=depth, noise_scale=noise_scale, seed=seed
+            )
         return generate_world_heights(
             width=width, depth=depth, noise_scale=noise_scale, seed=seed
         )